@@ -0,0 +1,76 @@
+"""
+  Compare the size, ratio and time of the response encodings on
+  synthetic Tower responses, from small single objects to full pages.
+  legacy is what zip_json_contents produced before it was tunable,
+  the JSON envelope compressed with gzip at level 9.
+
+  The payloads are held out from the zdict samples, they are drawn with
+  another seed and have ids outside the samples. They are still built
+  by benchmarks/tower_data.py from the same templates as the version 1
+  dictionary, so the zdict ratios are an upper bound of what it gets
+  on responses from a real Tower.
+
+  python benchmarks/bench_compression.py
+"""
+import gzip
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from receptor_catalog import zdict  # noqa: E402
+from receptor_catalog.codec import raw_body_document  # noqa: E402
+import tower_data  # noqa: E402
+
+LEVEL = 6
+HELD_OUT_SEED = 2
+
+ENCODINGS = {
+    "legacy": lambda body: gzip.compress(
+        json.dumps(dict(status=200, body=body)).encode("utf-8")
+    ),
+    "gzip": lambda body: gzip.compress(
+        json.dumps(dict(status=200, body=body)).encode("utf-8"), compresslevel=LEVEL
+    ),
+    "gzip_raw": lambda body: gzip.compress(
+        raw_body_document(200, body).encode("utf-8"), compresslevel=LEVEL
+    ),
+    "zdict": lambda body: zdict.compress(
+        raw_body_document(200, body).encode("utf-8"), level=LEVEL
+    ),
+}
+
+PAYLOADS = {
+    "job": lambda: tower_data.job(4242),
+    "job_template": lambda: tower_data.job_template(4242),
+    "inventory": lambda: tower_data.inventory(4242),
+    "job_templates page_size=5": lambda: tower_data.list_response(
+        tower_data.job_template, 1000, 5, 20
+    ),
+    "job_templates page_size=200": lambda: tower_data.list_response(
+        tower_data.job_template, 1000, 200, 2
+    ),
+}
+
+
+def main():
+    """ Print the size, ratio and time of every encoding for every payload """
+    tower_data.RANDOM.seed(HELD_OUT_SEED)
+    for title, build in PAYLOADS.items():
+        body = json.dumps(build(), separators=(",", ":"))
+        print(f"{title} ({len(body)} bytes)")
+        for name, encode in ENCODINGS.items():
+            size = len(encode(body))
+            number = max(1, 200000 // len(body))
+            elapsed = min(timeit.repeat(lambda: encode(body), number=number, repeat=3))
+            print(
+                f"  {name:9} {size:8} bytes  ratio {len(body) / size:6.2f}"
+                f"  {elapsed / number * 1000:8.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+  Benchmark the JSON codecs on realistic Tower list responses
+  Measures the per page cost of what the worker does on a page,
+  decoding the body from Tower and encoding the filtered body.
+
+  python benchmarks/bench_json.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from receptor_catalog.codec import AVAILABLE_CODECS, JSONCodec  # noqa: E402
+import tower_data  # noqa: E402
+
+PAGES = {
+    "job_templates page_size=25": (tower_data.job_template, 25),
+    "job_templates page_size=200": (tower_data.job_template, 200),
+    "inventories page_size=200": (tower_data.inventory, 200),
+    "jobs page_size=200": (tower_data.job, 200),
+}
+
+
+def per_page(codec, body, number):
+    """ Seconds spent to decode and encode one page """
+
+    def roundtrip():
+        codec.dumps(codec.loads(body))
+
+    return min(timeit.repeat(roundtrip, number=number, repeat=5)) / number
+
+
+def main():
+    """ Print the per page time of every installed codec """
+    for title, (builder, page_size) in PAGES.items():
+        body = JSONCodec.dumps(tower_data.list_response(builder, 1000, page_size))
+        number = max(1, 2000 // page_size)
+        timings = {
+            name: per_page(codec, body, number)
+            for name, codec in sorted(AVAILABLE_CODECS.items())
+        }
+        baseline = timings["json"]
+        print(f"{title} ({len(body) // 1024} KB)")
+        for name, elapsed in timings.items():
+            print(
+                f"  {name:8} {elapsed * 1000:8.3f} ms/page  {baseline / elapsed:5.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
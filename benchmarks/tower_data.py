@@ -0,0 +1,301 @@
+"""
+  Realistic Ansible Tower API list responses for the benchmarks
+  The varying fields are drawn from RANDOM, write_samples seeds it so the
+  samples, and the zdict dictionary built from them, can be reproduced.
+  The version 1 dictionary shipped in receptor_catalog/dictionaries is
+  built with
+
+      python benchmarks/tower_data.py /tmp/tower_samples
+      python tools/build_zdict.py --version 1 /tmp/tower_samples
+
+  where /tmp/tower_samples is a new directory, build_zdict.py reads
+  every *.json file in it.
+"""
+import json
+import os
+import random
+import sys
+
+TIMESTAMP = "2020-03-06T21:56:55.134663Z"
+SAMPLE_SEED = 1
+RANDOM = random.Random(SAMPLE_SEED)
+
+
+def job_template(object_id):
+    """ A job template as returned by /api/v2/job_templates/ """
+    return {
+        "id": object_id,
+        "type": "job_template",
+        "url": f"/api/v2/job_templates/{object_id}/",
+        "related": {
+            name: f"/api/v2/job_templates/{object_id}/{name}/"
+            for name in (
+                "labels",
+                "inventory",
+                "project",
+                "credentials",
+                "launch",
+                "jobs",
+                "schedules",
+                "activity_stream",
+                "survey_spec",
+                "access_list",
+                "object_roles",
+                "instance_groups",
+                "copy",
+            )
+        },
+        "summary_fields": {
+            "organization": {"id": 1, "name": "Default", "description": ""},
+            "inventory": {
+                "id": 2,
+                "name": "Demo Inventory",
+                "description": "",
+                "has_active_failures": False,
+                "total_hosts": 12,
+                "hosts_with_active_failures": 0,
+                "total_groups": 3,
+                "has_inventory_sources": False,
+                "total_inventory_sources": 0,
+                "inventory_sources_with_failures": 0,
+                "organization_id": 1,
+                "kind": "",
+            },
+            "project": {
+                "id": 6,
+                "name": "Demo Project",
+                "description": "",
+                "status": "successful",
+                "scm_type": "git",
+            },
+            "created_by": {
+                "id": 1,
+                "username": "admin",
+                "first_name": "",
+                "last_name": "",
+            },
+            "modified_by": {
+                "id": 1,
+                "username": "admin",
+                "first_name": "",
+                "last_name": "",
+            },
+            "user_capabilities": {
+                "edit": True,
+                "delete": True,
+                "start": True,
+                "schedule": True,
+                "copy": True,
+            },
+            "labels": {"count": 0, "results": []},
+            "survey": {"title": "", "description": ""},
+            "recent_jobs": [
+                {
+                    "id": object_id * 10 + job,
+                    "status": RANDOM.choice(["successful", "failed"]),
+                    "finished": TIMESTAMP,
+                    "type": "job",
+                }
+                for job in range(3)
+            ],
+        },
+        "created": TIMESTAMP,
+        "modified": TIMESTAMP,
+        "name": f"Job Template {object_id}",
+        "description": f"Provision a service for order {object_id}",
+        "job_type": "run",
+        "inventory": 2,
+        "project": 6,
+        "playbook": "hello_world.yml",
+        "scm_branch": "",
+        "forks": 0,
+        "limit": "",
+        "verbosity": 0,
+        "extra_vars": "---\nservice_name: demo\n",
+        "job_tags": "",
+        "force_handlers": False,
+        "skip_tags": "",
+        "start_at_task": "",
+        "timeout": 0,
+        "use_fact_cache": False,
+        "last_job_run": TIMESTAMP,
+        "last_job_failed": False,
+        "next_job_run": None,
+        "status": "successful",
+        "host_config_key": "",
+        "ask_scm_branch_on_launch": False,
+        "ask_diff_mode_on_launch": False,
+        "ask_variables_on_launch": True,
+        "ask_limit_on_launch": False,
+        "ask_tags_on_launch": False,
+        "ask_skip_tags_on_launch": False,
+        "ask_job_type_on_launch": False,
+        "ask_verbosity_on_launch": False,
+        "ask_inventory_on_launch": False,
+        "ask_credential_on_launch": False,
+        "survey_enabled": True,
+        "become_enabled": False,
+        "diff_mode": False,
+        "allow_simultaneous": False,
+        "custom_virtualenv": None,
+        "job_slice_count": 1,
+        "webhook_service": "",
+        "webhook_credential": None,
+    }
+
+
+def job(object_id):
+    """ A job as returned by /api/v2/jobs/<id>/ """
+    return {
+        "id": object_id,
+        "type": "job",
+        "url": f"/api/v2/jobs/{object_id}/",
+        "related": {
+            name: f"/api/v2/jobs/{object_id}/{name}/"
+            for name in (
+                "created_by",
+                "labels",
+                "inventory",
+                "project",
+                "credentials",
+                "unified_job_template",
+                "stdout",
+                "job_events",
+                "job_host_summaries",
+                "activity_stream",
+                "notifications",
+                "cancel",
+                "relaunch",
+            )
+        },
+        "summary_fields": {
+            "job_template": {"id": 7, "name": "Demo Job Template", "description": ""},
+            "unified_job_template": {
+                "id": 7,
+                "name": "Demo Job Template",
+                "description": "",
+                "unified_job_type": "job",
+            },
+            "created_by": {
+                "id": 1,
+                "username": "admin",
+                "first_name": "",
+                "last_name": "",
+            },
+            "user_capabilities": {"delete": True, "start": True},
+        },
+        "created": TIMESTAMP,
+        "modified": TIMESTAMP,
+        "name": "Demo Job Template",
+        "description": "",
+        "job_type": "run",
+        "inventory": 2,
+        "project": 6,
+        "playbook": "hello_world.yml",
+        "launch_type": "manual",
+        "status": RANDOM.choice(["successful", "failed", "running", "pending"]),
+        "failed": False,
+        "started": TIMESTAMP,
+        "finished": TIMESTAMP,
+        "elapsed": round(RANDOM.uniform(1, 600), 3),
+        "job_explanation": "",
+        "execution_node": "localhost",
+        "controller_node": "",
+        "extra_vars": '{"service_name": "demo"}',
+        "artifacts": {"expose_to_cloud_redhat_com_ticket": object_id},
+        "scm_revision": "347e44fea036c94d5f60e544de006453ee5c71ad",
+        "event_processing_finished": True,
+    }
+
+
+def inventory(object_id):
+    """ An inventory as returned by /api/v2/inventories/ """
+    return {
+        "id": object_id,
+        "type": "inventory",
+        "url": f"/api/v2/inventories/{object_id}/",
+        "related": {
+            name: f"/api/v2/inventories/{object_id}/{name}/"
+            for name in (
+                "hosts",
+                "groups",
+                "root_groups",
+                "variable_data",
+                "script",
+                "tree",
+                "inventory_sources",
+                "update_inventory_sources",
+                "activity_stream",
+                "job_templates",
+                "ad_hoc_commands",
+                "access_list",
+                "object_roles",
+                "instance_groups",
+                "copy",
+                "organization",
+            )
+        },
+        "summary_fields": {
+            "organization": {"id": 1, "name": "Default", "description": ""},
+            "user_capabilities": {
+                "edit": True,
+                "delete": True,
+                "copy": True,
+                "adhoc": True,
+            },
+        },
+        "created": TIMESTAMP,
+        "modified": TIMESTAMP,
+        "name": f"Inventory {object_id}",
+        "description": "",
+        "organization": 1,
+        "kind": "",
+        "host_filter": None,
+        "variables": "",
+        "has_active_failures": False,
+        "total_hosts": RANDOM.randint(0, 500),
+        "hosts_with_active_failures": 0,
+        "total_groups": RANDOM.randint(0, 20),
+        "has_inventory_sources": False,
+        "total_inventory_sources": 0,
+        "inventory_sources_with_failures": 0,
+        "insights_credential": None,
+        "pending_deletion": False,
+    }
+
+
+def list_response(builder, count, page_size, page=1):
+    """ A page of a Tower collection """
+    first = (page - 1) * page_size
+    last = min(first + page_size, count)
+    collection = builder(1)["url"].rsplit("/", 2)[0] + "/"
+    return {
+        "count": count,
+        "next": f"{collection}?page={page + 1}" if last < count else None,
+        "previous": f"{collection}?page={page - 1}" if page > 1 else None,
+        "results": [builder(object_id + 1) for object_id in range(first, last)],
+    }
+
+
+def write_samples(directory, count=60, seed=SAMPLE_SEED):
+    """ Write sample Tower responses for tools/build_zdict.py, single
+        objects and small pages of every kind both in the compact form
+        Tower renders them and in the form the json module encodes them
+    """
+    RANDOM.seed(seed)
+    os.makedirs(directory, exist_ok=True)
+    for builder in (job_template, job, inventory):
+        for object_id in range(1, count + 1):
+            documents = {
+                "object": builder(object_id),
+                "page": list_response(builder, count, 5, object_id % 5 + 1),
+            }
+            for kind, document in documents.items():
+                for style, separators in (("compact", (",", ":")), ("json", None)):
+                    name = f"{builder.__name__}_{kind}_{style}_{object_id}.json"
+                    with open(os.path.join(directory, name), "w") as sample:
+                        json.dump(document, sample, separators=separators)
+
+
+if __name__ == "__main__":
+    write_samples(sys.argv[1])
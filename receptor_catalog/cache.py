@@ -0,0 +1,107 @@
+"""
+  In process cache of GET responses from Tower
+  The cache is a memory bounded LRU keyed by the URL, the query params
+  and the identity of the credentials. Entries are revalidated with
+  If-None-Match/If-Modified-Since and served as is within their TTL.
+  The filtered bodies are kept with the entry, one per apply_filter,
+  so the filtering isn't repeated either.
+"""
+import collections
+import hashlib
+import json
+import threading
+import time
+
+
+class CacheEntry:
+    """ A cached response body and its validators """
+
+    def __init__(self, body, etag=None, last_modified=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = time.monotonic()
+        self.filtered = {}
+
+    def age(self):
+        """ Seconds since the entry was stored or last revalidated """
+        return time.monotonic() - self.stored_at
+
+    def validators(self):
+        """ Headers to revalidate the entry with Tower """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def size(self):
+        """ Characters held by the entry """
+        return len(self.body) + sum(len(body) for body in self.filtered.values())
+
+
+class ResponseCache:
+    """ Memory bounded LRU of responses, shared by the worker threads """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(url, params, authorization):
+        """ Cache key of a request, the credentials are only kept as a digest """
+        identity = hashlib.sha256(str(authorization).encode("utf-8")).hexdigest()
+        return (url, json.dumps(params, sort_keys=True, default=str), identity)
+
+    def get(self, key):
+        """ Get an entry and mark it as the most recently used """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        """ Store an entry, evicting the least recently used ones """
+        with self.lock:
+            self._remove(key)
+            if entry.size() > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.size += entry.size()
+            self._evict()
+
+    def put_filtered(self, key, entry, filter_key, body):
+        """ Store a filtered body along with its entry """
+        with self.lock:
+            if self.entries.get(key) is not entry:
+                return
+            self.size -= entry.size()
+            entry.filtered[filter_key] = body
+            self.size += entry.size()
+            self._evict()
+
+    def clear(self):
+        """ Drop all the entries """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self.entries:
+            _, entry = self.entries.popitem(last=False)
+            self.size -= entry.size()
+
+
+RESPONSE_CACHE = ResponseCache(32 * 1024 * 1024)
@@ -0,0 +1,132 @@
+"""
+  JSON codecs used on the worker hot path
+  orjson or ujson are used when they are installed, the standard
+  library json module is the fallback. The backend can be selected
+  with json_backend=auto|orjson|ujson|json in receptor.conf
+  Every codec decodes to the same objects, encodes to a str and
+  raises json.JSONDecodeError on bad input like the json module does.
+  The output is encoded with the json module unless compact output is
+  asked for with json_compact_output=True, orjson and ujson leave out
+  the spaces after the separators and orjson doesn't escape non ASCII
+  characters, so their output isn't byte for byte the same.
+"""
+import functools
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JSONCodec:
+    """ Codec based on the standard library json module """
+
+    name = "json"
+
+    @staticmethod
+    def loads(data):
+        """ Decode a JSON document """
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        """ Encode an object as a JSON str """
+        return json.dumps(obj)
+
+
+class OrjsonCodec(JSONCodec):
+    """ Codec based on orjson """
+
+    name = "orjson"
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+
+class UjsonCodec(JSONCodec):
+    """ Codec based on ujson """
+
+    name = "ujson"
+
+    @staticmethod
+    def loads(data):
+        try:
+            return ujson.loads(data)
+        except ValueError as err:
+            raise json.JSONDecodeError(str(err), str(data), 0)
+
+    @staticmethod
+    def dumps(obj):
+        return ujson.dumps(obj, escape_forward_slashes=False)
+
+
+AVAILABLE_CODECS = {"json": JSONCodec}
+if ujson is not None:
+    AVAILABLE_CODECS["ujson"] = UjsonCodec
+if orjson is not None:
+    AVAILABLE_CODECS["orjson"] = OrjsonCodec
+
+
+def raw_body_document(status, body, **extra):
+    """ Build a response document with a body that already is JSON embedded
+        as is instead of being escaped into a string, extra keys are added
+        to the document
+    """
+    fields = "".join(f'"{key}": {json.dumps(value)}, ' for key, value in extra.items())
+    return f'{{"status": {status}, {fields}"body_encoding": "json", "body": {body}}}'
+
+
+def encoded_size(value, budget):
+    """ Size of the JSON encoding of the value, the encoding is done piece
+        by piece and stops as soon as it is over the budget, in that case
+        the size returned is the part counted so far
+    """
+    if isinstance(value, str) and len(value) + 2 > budget:
+        return len(value) + 2
+    size = 0
+    for chunk in json.JSONEncoder().iterencode(value):
+        size += len(chunk)
+        if size > budget:
+            break
+    return size
+
+
+class DecodingCodec(JSONCodec):
+    """ Decodes with a faster backend and encodes with the json module,
+        so the output stays the same as without the backend
+    """
+
+    def __init__(self, backend):
+        self.name = backend.name
+        self.loads = backend.loads
+
+
+@functools.lru_cache(maxsize=None)
+def get_codec(name="auto", compact=False):
+    """ Get the codec for a backend name, auto picks the fastest one
+        installed. The backend only encodes when compact is True
+    """
+    if name == "auto":
+        for preferred in ("orjson", "ujson", "json"):
+            if preferred in AVAILABLE_CODECS:
+                name = preferred
+                break
+    if name not in AVAILABLE_CODECS:
+        raise Exception(
+            f"JSON backend {name} is not installed, available backends {sorted(AVAILABLE_CODECS)}"
+        )
+    backend = AVAILABLE_CODECS[name]
+    if compact or backend is JSONCodec:
+        return backend
+    return DecodingCodec(backend)
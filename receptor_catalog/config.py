@@ -0,0 +1,44 @@
+"""
+  Helpers to read typed values from the plugin config
+  The receptor hands us the [plugin_receptor_catalog] section of
+  receptor.conf as a dictionary of strings.
+"""
+from distutils.util import strtobool
+
+
+def to_bool(value):
+    """ Convert a boolean or a string like True|False to a boolean """
+    if isinstance(value, str):
+        value = strtobool(value)
+    return bool(value)
+
+
+def config_bool(config, key, default):
+    """ Fetch a boolean value from the config """
+    return to_bool(config.get(key, default))
+
+
+def config_int(config, key, default):
+    """ Fetch an integer value from the config """
+    value = config.get(key, default)
+    if value is None:
+        return None
+    return int(value)
+
+
+def payload_option(payload, config, key, default, cast=int):
+    """ Pop an option from the payload, falling back to the value in the
+        config and then to the default
+    """
+    value = payload.pop(key, config.get(key, default))
+    if value is None:
+        return None
+    return cast(value)
+
+
+def config_float(config, key, default):
+    """ Fetch a float value from the config """
+    value = config.get(key, default)
+    if value is None:
+        return None
+    return float(value)
@@ -0,0 +1,227 @@
+"""
+  Shared limits on the requests sent to each Tower
+  All the Run instances talking to a Tower host go through one limiter
+  that caps the number of requests in flight and paces them with a
+  token bucket, so a burst of fetch_all_pages requests can't tie up all
+  of Tower's workers. The limits are set in receptor.conf
+
+      max_in_flight=8
+      requests_per_second=20
+      rate_burst=20
+
+  The time spent waiting for a slot is recorded so the limits can be tuned.
+  Interactive requests, single GETs, POSTs and MONITORs, are served ahead
+  of the bulk requests that crawl all the pages of a collection. Without
+  max_in_flight the requests in flight are capped at the connections per
+  host of the pool, so they wait here by priority instead of first come
+  first served in the pool.
+"""
+from urllib.parse import urlparse
+import asyncio
+import heapq
+import itertools
+import time
+from .config import config_float, config_int
+from .runtime import Runtime
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITIES = {"interactive": INTERACTIVE, "bulk": BULK}
+
+
+class TokenBucket:
+    """ Token bucket refilled at rate tokens per second up to burst """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        """ Add the tokens earned since the last refill """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """ Seconds until a token is available """
+        self.refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        """ Take a token """
+        self.refill()
+        self.tokens -= 1
+
+
+class SharedPriority:
+    """ The priority of a request shared by several callers, it is raised
+        to the highest priority among them, even while the request waits
+        for a slot
+    """
+
+    def __init__(self, value):
+        self.value = value
+        self.waiting = None
+
+    def raise_to(self, value):
+        """ Raise the priority to value if that is higher """
+        if value >= self.value:
+            return
+        self.value = value
+        if self.waiting is not None:
+            limiter, entry = self.waiting
+            entry[0] = value
+            heapq.heapify(limiter.waiters)
+
+
+class Slot:
+    """ A request slot of a limiter, async with waits for it and gives the
+        seconds spent waiting
+    """
+
+    def __init__(self, limiter, priority):
+        self.limiter = limiter
+        self.priority = priority
+
+    async def __aenter__(self):
+        start = time.monotonic()
+        await self.limiter.acquire(self.priority)
+        waited = time.monotonic() - start
+        self.limiter.requests += 1
+        self.limiter.wait_seconds += waited
+        self.limiter.max_wait_seconds = max(self.limiter.max_wait_seconds, waited)
+        return waited
+
+    async def __aexit__(self, *exc_info):
+        self.limiter.release()
+
+
+class HostLimiter:
+    """ The request limits of a Tower host
+        The slots are handed out by priority and then in arrival order, so
+        interactive requests get ahead of the pages of a bulk crawl waiting
+        on the same Tower.
+    """
+
+    def __init__(self, max_in_flight=0, rate=0, burst=None, configured=True):
+        self.settings = (max_in_flight, rate, burst)
+        self.configured = configured
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate, burst or max(1, rate)) if rate else None
+        self.in_flight = 0
+        self.waiters = []
+        self.arrivals = itertools.count()
+        self.timer = None
+        self.requests = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def slot(self, priority=INTERACTIVE):
+        """ A request slot to wait for with async with """
+        return Slot(self, priority)
+
+    async def acquire(self, priority):
+        """ Wait until the slot is handed to us, the priority is a number or
+            a SharedPriority
+        """
+        future = asyncio.get_event_loop().create_future()
+        shared = priority if isinstance(priority, SharedPriority) else None
+        entry = [shared.value if shared else priority, next(self.arrivals), future]
+        heapq.heappush(self.waiters, entry)
+        if shared is not None:
+            shared.waiting = (self, entry)
+        self.dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            if shared is not None:
+                shared.waiting = None
+
+    def release(self):
+        """ Give back a slot and hand it to the next waiter """
+        self.in_flight -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        """ Hand out slots while the limits allow it """
+        while self.waiters:
+            future = self.waiters[0][2]
+            if future.cancelled():
+                heapq.heappop(self.waiters)
+                continue
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                return
+            if self.bucket is not None:
+                delay = self.bucket.delay()
+                if delay > 0:
+                    if self.timer is None:
+                        self.timer = asyncio.get_event_loop().call_later(
+                            delay, self.wake
+                        )
+                    return
+                self.bucket.take()
+            heapq.heappop(self.waiters)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def wake(self):
+        """ Dispatch once the bucket has a token again """
+        self.timer = None
+        self.dispatch()
+
+
+class LimiterRegistry:
+    """ The limiters of every Tower host, it is only used from the
+        background event loop
+    """
+
+    def __init__(self):
+        self.limiters = {}
+
+    @staticmethod
+    def settings(config):
+        """ The limits configured in receptor.conf """
+        return (
+            config_int(config, "max_in_flight", 0),
+            config_float(config, "requests_per_second", 0),
+            config_int(config, "rate_burst", None),
+        )
+
+    def limiter(self, url, config):
+        """ Get the limiter of the Tower host of the url, when the config
+            has no limits it only caps the requests at the connections per
+            host of the pool and configured is False
+        """
+        settings = self.settings(config)
+        configured = any(settings[:2])
+        if not settings[0]:
+            settings = (
+                config_int(
+                    config,
+                    "connection_limit_per_host",
+                    Runtime.DEFAULT_CONNECTION_LIMIT_PER_HOST,
+                ),
+            ) + settings[1:]
+        key = (urlparse(url).netloc, asyncio.get_event_loop())
+        limiter = self.limiters.get(key)
+        if limiter is None or (limiter.settings, limiter.configured) != (
+            settings,
+            configured,
+        ):
+            limiter = HostLimiter(*settings, configured=configured)
+            self.limiters = {
+                (host, loop): value
+                for (host, loop), value in self.limiters.items()
+                if not loop.is_closed()
+            }
+            self.limiters[key] = limiter
+        return limiter
+
+
+LIMITERS = LimiterRegistry()
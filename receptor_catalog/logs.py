@@ -0,0 +1,60 @@
+"""
+  Logging helpers for the worker
+  Large values like response bodies are wrapped in a Preview, which is
+  only formatted when a record is actually emitted and then truncated,
+  so disabled debug logging costs nothing. The debug messages of a Run
+  can be sampled, only a fraction of the runs log them.
+"""
+import logging
+import random
+import reprlib
+
+DEFAULT_PREVIEW_SIZE = 512
+
+
+class PreviewRepr(reprlib.Repr):
+    """ Truncating repr that also cuts bytes before formatting them """
+
+    def repr_bytes(self, value, _level):
+        text = repr(value[: self.maxstring])
+        if len(value) > self.maxstring:
+            text += f"...({len(value)} bytes)"
+        return text
+
+    def repr_str(self, value, _level):
+        text = repr(value[: self.maxstring])
+        if len(value) > self.maxstring:
+            text += f"...({len(value)} chars)"
+        return text
+
+
+class Preview:
+    """ A value for a log message, formatted lazily and truncated """
+
+    def __init__(self, value, size=DEFAULT_PREVIEW_SIZE):
+        self.value = value
+        self.size = size
+
+    def __str__(self):
+        preview = PreviewRepr()
+        preview.maxstring = self.size
+        preview.maxother = self.size
+        preview.maxlevel = 3
+        return preview.repr(self.value)
+
+    __repr__ = __str__
+
+
+class RunLogger(logging.LoggerAdapter):
+    """ Logger of a Run, the request is added to the records as extra
+        fields and the debug messages are only kept for sampled runs
+    """
+
+    def __init__(self, logger, extra, sample_rate=1.0):
+        super().__init__(logger, extra)
+        self.sampled = sample_rate >= 1 or random.random() < sample_rate
+
+    def isEnabledFor(self, level):
+        if level <= logging.DEBUG and not self.sampled:
+            return False
+        return self.logger.isEnabledFor(level)
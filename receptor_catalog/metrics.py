@@ -0,0 +1,312 @@
+"""
+  Per phase instrumentation of the worker
+  Every Run records the time it spends in each phase, waiting on the
+  limits of the Tower, connecting, waiting for the first byte, reading,
+  parsing, filtering, encoding, compressing and putting the responses
+  on the queue, along with counters of requests, retries, pages and
+  bytes. When the run is over its metrics are handed to the sinks listed
+  in metrics_sinks in receptor.conf
+
+      metrics_sinks=log,prometheus_file,prometheus_http
+      metrics_file=/var/lib/receptor/receptor_catalog.prom
+      metrics_port=9180
+
+  More sinks can be added with register_sink.
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import aiohttp
+from aiohttp import web
+from .config import config_int
+
+PHASES = [
+    "queue_wait",
+    "connect",
+    "first_byte",
+    "read",
+    "parse",
+    "filter",
+    "encode",
+    "compress",
+    "queue_put",
+]
+COUNTERS = ["requests", "retries", "pages", "bytes_in", "bytes_out"]
+RUN_SECONDS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300]
+
+
+class RunMetrics:
+    """ The timings and counters of a Run, the phases are timed on the
+        event loop and in the worker threads
+    """
+
+    def __init__(self, method, href_slug):
+        self.method = method
+        self.href_slug = href_slug
+        self.started = time.monotonic()
+        self.seconds = None
+        self.phases = collections.defaultdict(float)
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def time(self, phase):
+        """ Time the block as part of a phase """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def add(self, phase, seconds):
+        """ Add seconds to a phase """
+        with self.lock:
+            self.phases[phase] += seconds
+
+    def count(self, name, value=1):
+        """ Add to a counter """
+        with self.lock:
+            self.counters[name] += value
+
+    def finish(self):
+        """ The run is over """
+        self.seconds = time.monotonic() - self.started
+
+    def snapshot(self):
+        """ The metrics so far as a dictionary """
+        with self.lock:
+            seconds = self.seconds
+            if seconds is None:
+                seconds = time.monotonic() - self.started
+            return dict(
+                seconds=round(seconds, 6),
+                phases={
+                    phase: round(self.phases[phase], 6)
+                    for phase in PHASES
+                    if phase in self.phases
+                },
+                **{name: self.counters[name] for name in COUNTERS},
+            )
+
+
+async def on_request_start(_session, context, _params):
+    context.start = asyncio.get_event_loop().time()
+
+
+async def on_connection_create_start(_session, context, _params):
+    context.connect_start = asyncio.get_event_loop().time()
+
+
+async def on_connection_create_end(_session, context, _params):
+    metrics = context.trace_request_ctx
+    if isinstance(metrics, RunMetrics):
+        metrics.add("connect", asyncio.get_event_loop().time() - context.connect_start)
+
+
+async def on_request_end(_session, context, _params):
+    metrics = context.trace_request_ctx
+    if isinstance(metrics, RunMetrics):
+        metrics.add("first_byte", asyncio.get_event_loop().time() - context.start)
+
+
+async def on_response_chunk_received(_session, context, params):
+    metrics = context.trace_request_ctx
+    if isinstance(metrics, RunMetrics):
+        metrics.count("bytes_in", len(params.chunk))
+
+
+def trace_config():
+    """ The aiohttp trace config timing the connections and the first byte
+        of the requests sent with a RunMetrics as trace_request_ctx
+    """
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_connection_create_start.append(on_connection_create_start)
+    config.on_connection_create_end.append(on_connection_create_end)
+    config.on_request_end.append(on_request_end)
+    config.on_response_chunk_received.append(on_response_chunk_received)
+    return config
+
+
+class MetricsRegistry:
+    """ The metrics of all the runs in the Prometheus text format """
+
+    def __init__(self):
+        self.runs = collections.Counter()
+        self.run_buckets = collections.Counter()
+        self.run_seconds = collections.Counter()
+        self.phases = collections.Counter()
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+
+    def record(self, metrics):
+        """ Add the metrics of a finished run """
+        snapshot = metrics.snapshot()
+        method = metrics.method
+        with self.lock:
+            self.runs[method] += 1
+            self.run_seconds[method] += snapshot["seconds"]
+            for bucket in RUN_SECONDS_BUCKETS:
+                if snapshot["seconds"] <= bucket:
+                    self.run_buckets[(method, bucket)] += 1
+            for phase, seconds in snapshot["phases"].items():
+                self.phases[(method, phase)] += seconds
+            for name in COUNTERS:
+                self.counters[(method, name)] += snapshot[name]
+
+    def render(self):
+        """ The metrics in the Prometheus text exposition format """
+        lines = [
+            "# HELP receptor_catalog_run_seconds Time taken by the requests",
+            "# TYPE receptor_catalog_run_seconds histogram",
+        ]
+        with self.lock:
+            for method in sorted(self.runs):
+                for bucket in RUN_SECONDS_BUCKETS:
+                    lines.append(
+                        f'receptor_catalog_run_seconds_bucket{{method="{method}",le="{bucket}"}} '
+                        f"{self.run_buckets[(method, bucket)]}"
+                    )
+                lines.append(
+                    f'receptor_catalog_run_seconds_bucket{{method="{method}",le="+Inf"}} '
+                    f"{self.runs[method]}"
+                )
+                lines.append(
+                    f'receptor_catalog_run_seconds_sum{{method="{method}"}} '
+                    f"{self.run_seconds[method]}"
+                )
+                lines.append(
+                    f'receptor_catalog_run_seconds_count{{method="{method}"}} '
+                    f"{self.runs[method]}"
+                )
+            lines.append(
+                "# HELP receptor_catalog_phase_seconds_total Time spent in each phase"
+            )
+            lines.append("# TYPE receptor_catalog_phase_seconds_total counter")
+            for (method, phase), seconds in sorted(self.phases.items()):
+                lines.append(
+                    f'receptor_catalog_phase_seconds_total{{method="{method}",phase="{phase}"}} '
+                    f"{seconds}"
+                )
+            for name in COUNTERS:
+                lines.append(f"# TYPE receptor_catalog_{name}_total counter")
+                for (method, counter), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(
+                            f'receptor_catalog_{name}_total{{method="{method}"}} {value}'
+                        )
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Sink:
+    """ Receives the metrics of every finished run """
+
+    async def prepare(self):
+        """ Set up the sink, called from the background loop """
+
+    def emit(self, metrics):
+        """ Handle the metrics of a finished run, called in a worker thread
+            after the run was recorded in the REGISTRY
+        """
+
+
+class LogSink(Sink):
+    """ Logs one structured line per run """
+
+    def __init__(self, config):
+        self.logger = logging.getLogger(__name__)
+
+    def emit(self, metrics):
+        self.logger.info(
+            "Run metrics %s",
+            json.dumps(
+                dict(
+                    metrics.snapshot(),
+                    method=metrics.method,
+                    href_slug=metrics.href_slug,
+                )
+            ),
+        )
+
+
+class PrometheusFileSink(Sink):
+    """ Writes the Prometheus metrics to a file, e.g. for the textfile
+        collector of the node exporter
+    """
+
+    def __init__(self, config):
+        if not config.get("metrics_file"):
+            raise Exception("metrics_file needs to be set for the prometheus_file sink")
+        self.path = config["metrics_file"]
+
+    def emit(self, metrics):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, delete=False, suffix=".tmp"
+        ) as metrics_file:
+            metrics_file.write(REGISTRY.render())
+        os.replace(metrics_file.name, self.path)
+
+
+class PrometheusHttpSink(Sink):
+    """ Serves the Prometheus metrics at /metrics on a local port """
+
+    servers = {}
+
+    def __init__(self, config):
+        self.port = config_int(config, "metrics_port", None)
+        if self.port is None:
+            raise Exception("metrics_port needs to be set for the prometheus_http sink")
+        self.host = config.get("metrics_host", "127.0.0.1")
+
+    async def prepare(self):
+        key = (self.host, self.port)
+        runner = self.servers.get(key)
+        if runner is not None and runner.server is not None:
+            return
+        app = web.Application()
+        app.add_routes([web.get("/metrics", self.handler)])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        self.servers[key] = runner
+
+    @staticmethod
+    async def handler(_request):
+        return web.Response(
+            text=REGISTRY.render(), content_type="text/plain", charset="utf-8"
+        )
+
+
+SINKS = dict(
+    log=LogSink, prometheus_file=PrometheusFileSink, prometheus_http=PrometheusHttpSink
+)
+
+
+def register_sink(name, factory):
+    """ Make a sink available for metrics_sinks, the factory is called with
+        the config
+    """
+    SINKS[name] = factory
+
+
+def sinks_from_config(config):
+    """ Build the sinks listed in metrics_sinks """
+    sinks = []
+    for name in config.get("metrics_sinks", "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in SINKS:
+            raise Exception(f"Unknown metrics sink {name}, valid sinks {sorted(SINKS)}")
+        sinks.append(SINKS[name](config))
+    return sinks
@@ -0,0 +1,243 @@
+"""
+  Process wide registry of monitored Tower jobs
+  Instead of every MONITOR request polling its own job, the watched job
+  ids of a Tower host are merged into batched list queries
+  /api/v2/jobs/?id__in=... sent on one schedule, so the cost of polling
+  grows with the number of batches and not the number of jobs.
+  The queries go through the fetch of one of the callers, with its
+  retries, limits and timeouts, a query that still fails transiently is
+  sent again on the next poll.
+"""
+from datetime import datetime, timezone
+import asyncio
+import json
+import logging
+import random
+from .retry import RETRY_ERRORS, RETRY_STATUSES
+
+
+class PollSchedule:
+    """ Adaptive polling schedule, polls quickly at first and backs off
+        geometrically up to a cap. Jitter keeps monitors from polling in
+        lockstep and the time a job has been running can be used to
+        estimate how far off its completion is.
+    """
+
+    DEFAULT_INITIAL_SECONDS = 1
+    DEFAULT_BACKOFF_FACTOR = 2
+    DEFAULT_MAX_SECONDS = 60
+    DEFAULT_JITTER = 0.1
+    ELAPSED_FRACTION = 0.25
+    TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+    def __init__(
+        self,
+        initial=DEFAULT_INITIAL_SECONDS,
+        factor=DEFAULT_BACKOFF_FACTOR,
+        maximum=DEFAULT_MAX_SECONDS,
+        jitter=DEFAULT_JITTER,
+        use_elapsed=False,
+    ):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.jitter = jitter
+        self.use_elapsed = use_elapsed
+
+    def delay(self, polls, job=None):
+        """ Seconds to wait after the given number of polls """
+        delay = min(self.maximum, self.initial * self.factor ** min(polls - 1, 32))
+        if self.use_elapsed and job:
+            delay = min(
+                self.maximum, max(delay, self.elapsed(job) * self.ELAPSED_FRACTION)
+            )
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def elapsed(self, job):
+        """ Seconds the job has been running, Tower only fills in elapsed
+            once a job is finished so it is computed from started otherwise
+        """
+        elapsed = job.get("elapsed", None)
+        if isinstance(elapsed, (int, float)) and elapsed > 0:
+            return elapsed
+        try:
+            started = datetime.strptime(job["started"], self.TIMESTAMP_FORMAT)
+        except (KeyError, TypeError, ValueError):
+            return 0
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return max(0, (now - started).total_seconds())
+
+
+class Watcher:
+    """ A caller waiting on a job, fetch gets a page from Tower for it """
+
+    def __init__(self, future, schedule, fetch):
+        self.future = future
+        self.schedule = schedule
+        self.fetch = fetch
+        self.polls = 0
+        self.job = None
+
+
+class JobMonitor:
+    """ Polls all the watched jobs of a Tower jobs collection in batches """
+
+    JOB_COMPLETION_STATUSES = ["successful", "failed", "error", "canceled"]
+    BATCH_SIZE = 50
+
+    def __init__(self, session, list_url):
+        self.session = session
+        self.list_url = list_url
+        self.watchers = {}
+        self.task = None
+        self.wakeup = asyncio.Event()
+        self.polls = 0
+        self.logger = logging.getLogger(__name__)
+
+    async def wait(self, job_id, schedule, fetch):
+        """ Wait until the job reaches a completion status, returns the
+            job from the list query and the number of polls it took
+        """
+        watcher = Watcher(asyncio.get_event_loop().create_future(), schedule, fetch)
+        self.watchers.setdefault(job_id, []).append(watcher)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.poll())
+        else:
+            # The new job is due now, not after the backed off sleep
+            self.wakeup.set()
+        try:
+            return await watcher.future, watcher.polls
+        finally:
+            self.remove(job_id, watcher.future)
+
+    def remove(self, job_id, future):
+        """ Stop watching a job for a caller """
+        watchers = [
+            watcher
+            for watcher in self.watchers.get(job_id, [])
+            if watcher.future is not future
+        ]
+        if watchers:
+            self.watchers[job_id] = watchers
+        else:
+            self.watchers.pop(job_id, None)
+
+    def interval(self):
+        """ Poll as soon as the schedule of any caller asks for """
+        return min(
+            watcher.schedule.delay(watcher.polls, watcher.job)
+            for watchers in self.watchers.values()
+            for watcher in watchers
+        )
+
+    async def poll(self):
+        """ Poll the watched jobs until there are none left, a job that
+            joins while the poller sleeps wakes it up
+        """
+        while self.watchers:
+            self.wakeup.clear()
+            job_ids = sorted(self.watchers)
+            batches = [
+                job_ids[index : index + self.BATCH_SIZE]
+                for index in range(0, len(job_ids), self.BATCH_SIZE)
+            ]
+            await asyncio.gather(*[self.poll_batch(batch) for batch in batches])
+            if self.watchers:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.interval())
+                except asyncio.TimeoutError:
+                    pass
+
+    async def poll_batch(self, job_ids):
+        """ Query a batch of jobs and resolve the completed ones """
+        fetch = self.fetch(job_ids)
+        if fetch is None:
+            return
+        params = {
+            "id__in": ",".join(str(job_id) for job_id in job_ids),
+            "page_size": len(job_ids),
+        }
+        self.polls += 1
+        try:
+            response = await fetch(self.list_url, params)
+            status, body = response["status"], response["body"]
+            if status in RETRY_STATUSES:
+                self.logger.warning(
+                    "Polling jobs %s failed with status %s, polling again",
+                    params["id__in"],
+                    status,
+                )
+                return
+            if status != 200:
+                raise Exception(
+                    f"Get failed {self.list_url} status {status} body {body}"
+                )
+            jobs = {job["id"]: job for job in json.loads(body)["results"]}
+        except RETRY_ERRORS as err:
+            self.logger.warning(
+                "Polling jobs %s failed with %r, polling again", params["id__in"], err
+            )
+            return
+        except Exception as err:  # pylint: disable=broad-except
+            self.resolve(job_ids, error=err)
+            return
+
+        for job_id in job_ids:
+            job = jobs.get(job_id, None)
+            for watcher in self.watchers.get(job_id, []):
+                watcher.polls += 1
+                watcher.job = job
+            if job is None:
+                self.resolve([job_id], error=Exception(f"Job {job_id} not found"))
+            elif job["status"] in self.JOB_COMPLETION_STATUSES:
+                self.resolve([job_id], job=job)
+
+    def fetch(self, job_ids):
+        """ The fetch of a caller still waiting on one of the jobs """
+        for job_id in job_ids:
+            for watcher in self.watchers.get(job_id, []):
+                return watcher.fetch
+        return None
+
+    def resolve(self, job_ids, job=None, error=None):
+        """ Hand the job or the error to everyone waiting on the jobs """
+        for job_id in job_ids:
+            for watcher in self.watchers.pop(job_id, []):
+                if watcher.future.done():
+                    continue
+                if error is not None:
+                    watcher.future.set_exception(error)
+                else:
+                    watcher.future.set_result(job)
+
+
+class MonitorRegistry:
+    """ The job monitors for every session and Tower jobs collection,
+        it is only used from the background event loop
+    """
+
+    def __init__(self):
+        self.monitors = {}
+
+    def monitor(self, session, list_url):
+        """ Get the job monitor of a session and jobs collection """
+        key = (id(session), list_url)
+        job_monitor = self.monitors.get(key)
+        if job_monitor is None or job_monitor.session is not session:
+            job_monitor = JobMonitor(session, list_url)
+            self.monitors[key] = job_monitor
+        return job_monitor
+
+    async def wait(self, session, list_url, job_id, schedule, fetch):
+        """ Wait for a job to complete using the shared batched polling,
+            fetch(url, params) gets a page from Tower for the caller
+        """
+        job_monitor = self.monitor(session, list_url)
+        try:
+            return await job_monitor.wait(job_id, schedule, fetch)
+        finally:
+            if not job_monitor.watchers:
+                self.monitors.pop((id(session), list_url), None)
+
+
+MONITORS = MonitorRegistry()
@@ -0,0 +1,151 @@
+"""
+  Retries of the idempotent calls to Tower and a circuit breaker per host
+  GETs that fail with a transient status or a connection error are
+  retried with a backoff and jitter, honouring Retry-After. The retries
+  of a host draw from a budget refilled by its successful requests so
+  retries can't multiply the load on a struggling Tower. After a number
+  of consecutive failures the circuit of the host opens and requests fail
+  fast until a trial request gets through after the reset period.
+"""
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import asyncio
+import time
+import aiohttp
+from .config import config_float, config_int
+
+RETRY_STATUSES = [429, 502, 503, 504]
+RETRY_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+FAILURE_STATUSES = [500, 502, 503, 504]
+
+
+def retry_after_seconds(value):
+    """ Seconds to wait from a Retry-After header, in seconds or a date """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryBudget:
+    """ Tokens spent by retries, every request earns a fraction of a token """
+
+    def __init__(self, size, ratio):
+        self.size = size
+        self.ratio = ratio
+        self.tokens = size
+
+    def earn(self):
+        """ A request went through """
+        self.tokens = min(self.size, self.tokens + self.ratio)
+
+    def spend(self):
+        """ Take a token for a retry, False when the budget is spent """
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """ Fails requests fast once a host failed too many times in a row """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, host, threshold, reset_seconds, budget):
+        self.host = host
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.budget = budget
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def check(self):
+        """ Raise if requests to the host should fail fast, after the reset
+            period a single trial request is let through and True is
+            returned for it, finish_trial has to be called once it is over
+        """
+        if self.state == self.CLOSED:
+            return False
+        if (
+            self.state == self.OPEN
+            and time.monotonic() - self.opened_at >= self.reset_seconds
+        ):
+            self.state = self.HALF_OPEN
+            return True
+        raise Exception(
+            f"Circuit open for {self.host} after {self.failures} consecutive failures"
+        )
+
+    def success(self):
+        """ A request got an answer from the host """
+        self.state = self.CLOSED
+        self.failures = 0
+        self.budget.earn()
+
+    def finish_trial(self):
+        """ The trial request is over, unless it closed the circuit with a
+            success the circuit opens again, also when it got a 429, was
+            cancelled or failed in some other way
+        """
+        if self.state == self.HALF_OPEN:
+            self.failure()
+
+    def failure(self):
+        """ A request failed, opens the circuit past the threshold """
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.threshold and self.failures >= self.threshold
+        ):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class BreakerRegistry:
+    """ The circuit breakers of every Tower host """
+
+    DEFAULT_THRESHOLD = 5
+    DEFAULT_RESET_SECONDS = 30
+    DEFAULT_BUDGET = 10
+    DEFAULT_BUDGET_RATIO = 0.2
+
+    def __init__(self):
+        self.breakers = {}
+
+    def breaker(self, url, config):
+        """ Get the circuit breaker of the Tower host of the url """
+        settings = (
+            config_int(config, "circuit_failure_threshold", self.DEFAULT_THRESHOLD),
+            config_float(config, "circuit_reset_seconds", self.DEFAULT_RESET_SECONDS),
+            config_int(config, "retry_budget", self.DEFAULT_BUDGET),
+            config_float(config, "retry_budget_ratio", self.DEFAULT_BUDGET_RATIO),
+        )
+        host = urlparse(url).netloc
+        breaker, current = self.breakers.get(host, (None, None))
+        if breaker is None or current != settings:
+            threshold, reset_seconds, size, ratio = settings
+            breaker = CircuitBreaker(
+                host, threshold, reset_seconds, RetryBudget(size, ratio)
+            )
+            self.breakers[host] = (breaker, settings)
+        return breaker
+
+    def clear(self):
+        """ Forget the state of every host """
+        self.breakers.clear()
+
+
+BREAKERS = BreakerRegistry()
@@ -0,0 +1,203 @@
+"""
+  Long lived runtime shared by all the Run instances
+  A single background event loop services every message sent to the
+  plugin, and a connection pooled aiohttp session is kept for each
+  Tower URL and credential set so TCP and TLS connections get reused
+  across messages instead of being set up for every request.
+"""
+from urllib.parse import urlparse
+import asyncio
+import atexit
+import ssl
+import threading
+import weakref
+import aiohttp
+from aiohttp.client_proto import ResponseHandler
+from .config import config_bool, config_int, config_float
+from .metrics import trace_config
+
+
+class TrackedResponseHandler(ResponseHandler):
+    """ Response handler that resolves a future once its transport is closed """
+
+    def __init__(self, loop):
+        super().__init__(loop=loop)
+        self.lost = loop.create_future()
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        if not self.lost.done():
+            self.lost.set_result(None)
+
+
+class DrainingConnector(aiohttp.TCPConnector):
+    """ TCP Connector that can wait for all of its transports to close """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.protocols = weakref.WeakSet()
+        self._factory = self.create_protocol
+
+    def create_protocol(self):
+        """ Build a tracked protocol for every new connection """
+        protocol = TrackedResponseHandler(self._loop)
+        self.protocols.add(protocol)
+        return protocol
+
+    async def drain(self, timeout):
+        """ Close the connector and wait until its transports are closed,
+            returns as soon as the last one is gone.
+        """
+        pending = [
+            protocol.lost for protocol in self.protocols if not protocol.lost.done()
+        ]
+        await self.close()
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+
+
+class Runtime:
+    """ Background event loop and pooled sessions for the worker """
+
+    DEFAULT_KEEPALIVE_TIMEOUT = 15
+    DEFAULT_CONNECTION_LIMIT = 100
+    DEFAULT_CONNECTION_LIMIT_PER_HOST = 10
+    DRAIN_TIMEOUT = 5
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.sessions = {}
+        self.websocket_sessions = {}
+        self.ssl_contexts = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """ Start the background event loop if it isn't running """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(
+                    target=self._run_forever, name="receptor_catalog", daemon=True
+                )
+                self.thread.start()
+            return self.loop
+
+    def _run_forever(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coroutine):
+        """ Run the coroutine on the background loop and wait for the result """
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    def ssl_context(self, verify_ssl):
+        """ Share SSL contexts so pooled TLS connections can be reused """
+        with self.lock:
+            if verify_ssl not in self.ssl_contexts:
+                context = ssl.SSLContext()
+                if not verify_ssl:
+                    context.verify_mode = ssl.CERT_NONE
+                self.ssl_contexts[verify_ssl] = context
+            return self.ssl_contexts[verify_ssl]
+
+    @staticmethod
+    def connector_options(config):
+        """ Connection pool settings read from receptor.conf
+            keepalive: True|False (default: True)
+            keepalive_timeout: seconds an idle connection is kept open (default: 15)
+            connection_limit: total connections in the pool (default: 100)
+            connection_limit_per_host: connections per Tower host (default: 10)
+        """
+        keepalive = config_bool(config, "keepalive", True)
+        options = dict(
+            limit=config_int(
+                config, "connection_limit", Runtime.DEFAULT_CONNECTION_LIMIT
+            ),
+            limit_per_host=config_int(
+                config,
+                "connection_limit_per_host",
+                Runtime.DEFAULT_CONNECTION_LIMIT_PER_HOST,
+            ),
+            force_close=not keepalive,
+        )
+        if keepalive:
+            options["keepalive_timeout"] = config_float(
+                config, "keepalive_timeout", Runtime.DEFAULT_KEEPALIVE_TIMEOUT
+            )
+        return options
+
+    def session_key(self, url, headers, config):
+        """ The sessions are shared per Tower URL, credentials and pool settings """
+        url_info = urlparse(url)
+        return (
+            f"{url_info.scheme}://{url_info.netloc}",
+            tuple(sorted(headers.items())),
+            tuple(sorted(self.connector_options(config).items())),
+        )
+
+    def session(self, url, headers, config):
+        """ Get the pooled session for a Tower URL and credential set,
+            this has to be called from the background loop.
+        """
+        key = self.session_key(url, headers, config)
+        session = self.sessions.get(key)
+        if session is None or session.closed:
+            connector = DrainingConnector(**self.connector_options(config))
+            session = aiohttp.ClientSession(
+                connector=connector, headers=headers, trace_configs=[trace_config()]
+            )
+            self.sessions[key] = session
+        return session
+
+    def websocket_session(self, url, headers, config):
+        """ Get the session for the websockets to a Tower, a websocket holds
+            its connection as long as the job runs so they get a connector
+            of their own without limits instead of taking connections from
+            the pool the requests wait on. The cookies are shared with the
+            pooled session, this has to be called from the background loop.
+        """
+        key = self.session_key(url, headers, config)
+        session = self.websocket_sessions.get(key)
+        if session is None or session.closed:
+            connector = DrainingConnector(limit=0, limit_per_host=0)
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers=headers,
+                cookie_jar=self.session(url, headers, config).cookie_jar,
+            )
+            self.websocket_sessions[key] = session
+        return session
+
+    async def close_sessions(self):
+        """ Close all the pooled sessions, instead of sleeping for a fixed
+            time we wait for the transports of every connector to be closed
+            so no sockets are left behind in CLOSE_WAIT state
+            https://github.com/aio-libs/aiohttp/issues/1925
+        """
+        sessions = list(self.sessions.values()) + list(self.websocket_sessions.values())
+        self.sessions.clear()
+        self.websocket_sessions.clear()
+        await asyncio.gather(
+            *[session.connector.drain(self.DRAIN_TIMEOUT) for session in sessions]
+        )
+        for session in sessions:
+            await session.close()
+
+    def shutdown(self):
+        """ Close the pools and stop the background loop """
+        with self.lock:
+            loop, thread = self.loop, self.thread
+            self.loop = None
+            self.thread = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close_sessions(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+RUNTIME = Runtime()
+atexit.register(RUNTIME.shutdown)
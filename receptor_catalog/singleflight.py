@@ -0,0 +1,49 @@
+"""
+  Single flight of identical concurrent requests
+  When a burst of identical GET requests reaches the plugin, only the
+  first one is sent to Tower and the others wait on its response. Every
+  caller still filters and encodes its own copy of the response.
+  The request waits for its slot at the highest priority of its callers,
+  its retries, deadline, circuit breaker and metrics are the ones of the
+  caller that started it.
+"""
+import asyncio
+
+
+class SingleFlight:
+    """ The requests in flight, it is only used from the background
+        event loop
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.shared = 0
+
+    async def do(self, key, fetch, priority=None):
+        """ Await the response of the request in flight for the key or
+            start a new one with fetch. The request keeps going when the
+            caller that started it is cancelled, so the others still get
+            the response. The SharedPriority of the request in flight is
+            raised to the priority of a caller joining it
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(fetch())
+            self.flights[key] = (task, priority)
+            task.add_done_callback(lambda done: self.land(key, done))
+        else:
+            task, shared = flight
+            self.shared += 1
+            if shared is not None and priority is not None:
+                shared.raise_to(priority.value)
+        return await asyncio.shield(task)
+
+    def land(self, key, task):
+        """ Forget a request once it is done """
+        if self.flights.get(key, (None, None))[0] is task:
+            del self.flights[key]
+        if not task.cancelled():
+            task.exception()
+
+
+IN_FLIGHT = SingleFlight()
@@ -0,0 +1,204 @@
+"""
+  Streaming parser for Tower list responses
+  A list response is read in pieces as it arrives and the items of its
+  results array are decoded one at a time. Every item is handed to a
+  projection as soon as it is complete, only the projected value is kept
+  so a page of hosts with big ansible_facts is never held in memory as a
+  whole. The other top level keys (count, next, previous) are decoded
+  as they are.
+"""
+import json
+from jmespath.parser import ParsedResult
+
+WHITESPACE = " \t\n\r"
+DELIMITERS = WHITESPACE + ",:]}"
+NEED_DATA = object()
+
+
+def item_expression(compiled, key="results"):
+    """ The per item part of a JMESPath projection over the key, e.g.
+        {id: id} for results[].{id: id}, None when the expression is not a
+        plain projection of the key
+    """
+    parsed = compiled.parsed
+    if parsed["type"] != "projection":
+        return None
+    source, item = parsed["children"]
+    field = {"type": "field", "children": [], "value": key}
+    if source != field and source != {"type": "flatten", "children": [field]}:
+        return None
+    return ParsedResult(compiled.expression, item)
+
+
+class ResultsParser:
+    """ Parses a JSON object fed in pieces, the items of its results array
+        are handed to project one at a time and only the projected values
+        are kept
+    """
+
+    def __init__(self, project, key="results"):
+        self.project = project
+        self.key = key
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.pieces = []
+        self.pending = 0
+        self.retry_at = 0
+        self.eof = False
+        self.document = {}
+        self.current_key = None
+        self.state = self.object_start
+
+    def feed(self, text):
+        """ Add the next piece of the document """
+        self.pieces.append(text)
+        self.pending += len(text)
+        # A value that didn't decode is only tried again once the data
+        # doubled, so a big item arriving in small pieces is decoded in
+        # linear time
+        if len(self.buffer) - self.position + self.pending < self.retry_at:
+            return
+        self.parse()
+
+    def close(self):
+        """ Finish parsing, returns the document with the projected results """
+        self.eof = True
+        self.parse()
+        if self.state is not None or self.buffer[self.position :].strip():
+            raise json.JSONDecodeError(
+                "Incomplete JSON document", self.buffer, self.position
+            )
+        return self.document
+
+    def parse(self):
+        self.buffer = self.buffer[self.position :] + "".join(self.pieces)
+        self.position = 0
+        self.pieces = []
+        self.pending = 0
+        self.retry_at = 0
+        while self.state is not None and self.state():
+            pass
+
+    def next_char(self):
+        """ Skip the whitespace, returns the next character or None """
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if char not in WHITESPACE:
+                return char
+            self.position += 1
+        return None
+
+    def expect(self, chars):
+        """ The next character, it has to be one of chars """
+        char = self.next_char()
+        if char is None:
+            return None
+        if char not in chars:
+            raise json.JSONDecodeError(
+                f"Expecting one of {chars}", self.buffer, self.position
+            )
+        self.position += 1
+        return char
+
+    def decode(self):
+        """ Decode the next value, NEED_DATA when it isn't complete yet """
+        if self.next_char() is None:
+            return NEED_DATA
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.position)
+        except json.JSONDecodeError:
+            if self.eof:
+                raise
+            self.retry_at = 2 * (len(self.buffer) - self.position)
+            return NEED_DATA
+        # A number could go on in the next piece
+        if not self.eof and (
+            end >= len(self.buffer) or self.buffer[end] not in DELIMITERS
+        ):
+            self.retry_at = len(self.buffer) - self.position + 1
+            return NEED_DATA
+        self.position = end
+        return value
+
+    def object_start(self):
+        if self.expect("{") is None:
+            return False
+        self.state = self.first_key
+        return True
+
+    def first_key(self):
+        char = self.next_char()
+        if char is None:
+            return False
+        if char == "}":
+            self.position += 1
+            self.state = None
+            return True
+        self.state = self.key_name
+        return True
+
+    def key_name(self):
+        key = self.decode()
+        if key is NEED_DATA:
+            return False
+        if not isinstance(key, str):
+            raise json.JSONDecodeError("Expecting a key", self.buffer, self.position)
+        self.current_key = key
+        self.state = self.key_colon
+        return True
+
+    def key_colon(self):
+        if self.expect(":") is None:
+            return False
+        self.state = self.key_value
+        return True
+
+    def key_value(self):
+        char = self.next_char()
+        if char is None:
+            return False
+        if self.current_key == self.key and char == "[":
+            self.position += 1
+            self.document[self.key] = []
+            self.state = self.first_item
+            return True
+        value = self.decode()
+        if value is NEED_DATA:
+            return False
+        self.document[self.current_key] = value
+        self.state = self.after_value
+        return True
+
+    def after_value(self):
+        char = self.expect(",}")
+        if char is None:
+            return False
+        self.state = self.key_name if char == "," else None
+        return True
+
+    def first_item(self):
+        char = self.next_char()
+        if char is None:
+            return False
+        if char == "]":
+            self.position += 1
+            self.state = self.after_value
+            return True
+        self.state = self.item
+        return True
+
+    def item(self):
+        value = self.decode()
+        if value is NEED_DATA:
+            return False
+        self.document[self.key].append(self.project(value))
+        self.state = self.after_item
+        return True
+
+    def after_item(self):
+        char = self.expect(",]")
+        if char is None:
+            return False
+        self.state = self.item if char == "," else self.after_value
+        return True
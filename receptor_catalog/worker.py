@@ -8,13 +8,38 @@ from urllib.parse import urlparse
 from urllib.parse import parse_qsl
 from urllib.parse import urljoin
 from distutils.util import strtobool
+import codecs
+import collections
+import functools
 import json
 import gzip
 import logging
-import ssl
+import re
+import time
 import asyncio
 import aiohttp
 import jmespath
+from jmespath.exceptions import JMESPathError
+from .cache import RESPONSE_CACHE, CacheEntry
+from .codec import encoded_size, get_codec, raw_body_document
+from .config import config_bool, config_float, config_int, payload_option, to_bool
+from .limiter import BULK, LIMITERS, PRIORITIES, SharedPriority
+from .logs import DEFAULT_PREVIEW_SIZE, Preview, RunLogger
+from .metrics import REGISTRY, RunMetrics, sinks_from_config
+from .monitor import MONITORS, JobMonitor, PollSchedule
+from .retry import (
+    BREAKERS,
+    FAILURE_STATUSES,
+    RETRY_ERRORS,
+    RETRY_STATUSES,
+    retry_after_seconds,
+)
+from .runtime import RUNTIME
+from .singleflight import IN_FLIGHT
+from .stream import ResultsParser, item_expression
+from . import zdict
+
+JMESPATH_CACHE_SIZE = 256
 
 
 def configure_logger():
@@ -27,20 +52,124 @@ def configure_logger():
     return logger
 
 
+@functools.lru_cache(maxsize=JMESPATH_CACHE_SIZE)
+def compile_filter(expression):
+    """ Compile a JMESPath expression, the compiled expressions are kept
+        in a process wide LRU cache, compile_filter.cache_info() has the
+        hit and miss counters
+    """
+    return jmespath.compile(expression)
+
+
 def receptor_export(func):
     """ Decorator function for receptor. """
     setattr(func, "receptor_export", True)
     return func
 
 
+class PageCoalescer:
+    """ Accumulate the filtered results of consecutive pages into a single
+        message until the byte or item budget is reached. Every message
+        carries a sequence number and a last_chunk marker so the controller
+        can reassemble the stream
+    """
+
+    def __init__(self, run, max_bytes, max_items):
+        self.run = run
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.sequence = 0
+        self.count = None
+        self.fragments = []
+        self.size = 0
+        self.items = 0
+
+    def add(self, count, results):
+        """ Add the filtered results of a page, sending the accumulated
+            results first when this page would exceed the budget
+        """
+        encoded = self.run.encode(results)[1:-1]
+        if self.fragments and (
+            self.size + len(encoded) > self.max_bytes
+            or self.items + len(results) > self.max_items
+        ):
+            self.flush(last_chunk=False)
+        self.count = count
+        if encoded:
+            self.fragments.append(encoded)
+        self.size += len(encoded)
+        self.items += len(results)
+
+    def flush(self, last_chunk):
+        """ Send the accumulated results as one message """
+        body = (
+            f'{{"count": {self.run.codec.dumps(self.count)}, '
+            f'"results": [{",".join(self.fragments)}]}}'
+        )
+        self.run.send_response(
+            dict(status=200, body=body, sequence=self.sequence, last_chunk=last_chunk)
+        )
+        self.sequence += 1
+        self.fragments = []
+        self.size = 0
+        self.items = 0
+
+
+class Throttle:
+    """ Holds a request slot of the limiter of the Tower, if there is one,
+        while a request of the run is sent
+    """
+
+    def __init__(self, run, priority=None):
+        self.run = run
+        self.priority = run.priority if priority is None else priority
+        self.slot = None
+
+    async def __aenter__(self):
+        if self.run.limiter is None:
+            return
+        self.slot = self.run.limiter.slot(self.priority)
+        waited = await self.slot.__aenter__()
+        self.run.queue_wait_seconds += waited
+        self.run.metrics.add("queue_wait", waited)
+        if waited > 0:
+            self.run.logger.debug("Waited %.3fs for a request slot", waited)
+
+    async def __aexit__(self, *exc_info):
+        if self.slot is not None:
+            await self.slot.__aexit__(*exc_info)
+
+
 class Run:
     """ The Run class to execute the work recieved from the controller """
 
     VALID_POST_CODES = [200, 201, 202]
-    JOB_COMPLETION_STATUSES = ["successful", "failed", "error", "canceled"]
-    DEFAULT_REFRESH_INTERVAL = 10
+    JOB_COMPLETION_STATUSES = JobMonitor.JOB_COMPLETION_STATUSES
+    WEBSOCKET_PATH = "/websocket/"
+    WEBSOCKET_HEARTBEAT = 30
+    WEBSOCKET_REPLY_SECONDS = 10
+    JOB_URL_PATTERN = re.compile(r"^(.*/jobs/)(\d+)/?$")
     ARTIFACTS_KEY_PREFIX = "expose_to_cloud_redhat_com_"
     MAX_ARTIFACTS_SIZE = 1024
+    DEFAULT_PAGE_CONCURRENCY = 4
+    DEFAULT_PAGE_QUEUE_DEPTH = 2
+    NEXT_PATTERN = re.compile(r'"next"\s*:\s*(null|"(?:[^"\\]|\\.)*")')
+    COUNT_PATTERN = re.compile(r'"count"\s*:\s*(\d+)')
+    COMPRESSED_ENCODINGS = ["gzip", "gzip_raw", "zdict"]
+    DEFAULT_GZIP_LEVEL = 6
+    DEFAULT_GZIP_MIN_SIZE = 0
+    DEFAULT_COALESCE_MAX_BYTES = 256 * 1024
+    DEFAULT_COALESCE_MAX_ITEMS = 1000
+    DEFAULT_CACHE_TTL = 0
+    DEFAULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    DEFAULT_RETRIES = 3
+    STREAM_CHUNK_SIZE = 64 * 1024
+    SYNC_ORDER = "modified,id"
+    SYNC_ID_PAGE_SIZE = 200
+    DEFAULT_CONNECT_TIMEOUT = 30
+    DEFAULT_READ_TIMEOUT = 300
+    DEFAULT_RETRY_INITIAL_SECONDS = 0.5
+    DEFAULT_RETRY_MAX_SECONDS = 30
 
     def __init__(self, queue, payload, config, logger):
         """ Initialize a Run instance with the following
@@ -51,168 +180,1010 @@ class Run:
         """
         self.result_queue = queue
         self.config = config
-        self.logger = logger
+        self.codec = get_codec(
+            config.get("json_backend", "auto"),
+            config_bool(config, "json_compact_output", False),
+        )
 
         self.href_slug = payload.pop("href_slug")
         self.method = payload.pop("method", "get").lower()
+        self.preview_size = config_int(config, "log_preview_size", DEFAULT_PREVIEW_SIZE)
+        self.logger = RunLogger(
+            logger,
+            dict(href_slug=self.href_slug, method=self.method),
+            payload_option(payload, config, "log_sample_rate", 1.0, float),
+        )
+        self.metrics = RunMetrics(self.method, self.href_slug)
+        self.include_timings = to_bool(
+            payload.pop("include_timings", config.get("include_timings", False))
+        )
+        self.sinks = sinks_from_config(config)
         self.fetch_all_pages = payload.pop("fetch_all_pages", False)
         if isinstance(self.fetch_all_pages, str):
             self.fetch_all_pages = strtobool(self.fetch_all_pages)
+        self.cursor = payload.pop("cursor", None) or {}
+        if self.method == "sync":
+            self.fetch_all_pages = True
+
+        self.page_concurrency = payload_option(
+            payload, config, "page_concurrency", self.DEFAULT_PAGE_CONCURRENCY
+        )
+        self.page_queue_depth = payload_option(
+            payload, config, "page_queue_depth", self.DEFAULT_PAGE_QUEUE_DEPTH
+        )
+        if self.page_queue_depth < 1:
+            # A queue of size 0 is unbounded in asyncio
+            raise Exception(
+                f"page_queue_depth has to be at least 1, got {self.page_queue_depth}"
+            )
+
+        self.coalescer = None
+        coalesce_pages = to_bool(payload.pop("coalesce_pages", False))
+        if coalesce_pages and self.fetch_all_pages:
+            self.coalescer = PageCoalescer(
+                self,
+                payload_option(
+                    payload,
+                    config,
+                    "coalesce_max_bytes",
+                    self.DEFAULT_COALESCE_MAX_BYTES,
+                ),
+                payload_option(
+                    payload,
+                    config,
+                    "coalesce_max_items",
+                    self.DEFAULT_COALESCE_MAX_ITEMS,
+                ),
+            )
 
         self.encoding = payload.pop("accept_encoding", None)
+        if self.encoding == "zdict" and not config_bool(
+            config, "zdict_experimental", False
+        ):
+            raise Exception(
+                "zdict is experimental and its dictionary can still change, "
+                "set zdict_experimental=True in receptor.conf to use it"
+            )
+        self.max_artifacts_size = config_int(
+            config, "max_artifacts_size", self.MAX_ARTIFACTS_SIZE
+        )
+        self.gzip_level = config_int(config, "gzip_level", self.DEFAULT_GZIP_LEVEL)
+        self.gzip_min_size = config_int(
+            config, "gzip_min_size", self.DEFAULT_GZIP_MIN_SIZE
+        )
         self.params = payload.pop("params", {})
         self.ssl_context = None
         self.apply_filters = payload.pop("apply_filter", None)
-        self.refresh_interval_seconds = payload.pop(
-            "refresh_interval_seconds", self.DEFAULT_REFRESH_INTERVAL
+        self.compiled_filters = self.compile_filters(self.apply_filters)
+        self.limiter = None
+        self.queue_wait_seconds = 0.0
+        priority = payload.pop(
+            "priority", "bulk" if self.fetch_all_pages else "interactive"
+        )
+        if priority not in PRIORITIES:
+            raise Exception(
+                f"Unknown priority {priority}, valid priorities {sorted(PRIORITIES)}"
+            )
+        self.priority = PRIORITIES[priority]
+        self.breaker = None
+        self.timeout_seconds = payload_option(
+            payload, config, "timeout_seconds", None, float
+        )
+        self.deadline = None
+        self.timed_out = False
+        self.tag = {}
+        connect_timeout = config_float(
+            config, "connect_timeout_seconds", self.DEFAULT_CONNECT_TIMEOUT
+        )
+        # connect includes the wait for a free connection of the pool
+        self.client_timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=connect_timeout,
+            sock_connect=connect_timeout,
+            sock_read=config_float(
+                config, "read_timeout_seconds", self.DEFAULT_READ_TIMEOUT
+            ),
+        )
+        self.retries = payload_option(payload, config, "retries", self.DEFAULT_RETRIES)
+        self.retry_schedule = PollSchedule(
+            initial=config_float(
+                config, "retry_initial_seconds", self.DEFAULT_RETRY_INITIAL_SECONDS
+            ),
+            factor=config_float(
+                config, "retry_backoff_factor", PollSchedule.DEFAULT_BACKOFF_FACTOR
+            ),
+            maximum=config_float(
+                config, "retry_max_seconds", self.DEFAULT_RETRY_MAX_SECONDS
+            ),
+            jitter=config_float(config, "retry_jitter", PollSchedule.DEFAULT_JITTER),
         )
+        self.filter_key = json.dumps(self.apply_filters, sort_keys=True)
+        self.item_filter = None
+        stream_results = payload.pop(
+            "stream_results", config.get("stream_results", False)
+        )
+        if to_bool(stream_results) and self.method == "get":
+            self.item_filter = self.streaming_filter()
+        self.sync_position = (self.cursor.get("modified", ""), self.cursor.get("id", 0))
+        self.sync_changed = 0
+        self.cache_ttl_seconds = payload_option(
+            payload, config, "cache_ttl_seconds", self.DEFAULT_CACHE_TTL, float
+        )
+        RESPONSE_CACHE.max_bytes = config_int(
+            config, "cache_max_bytes", self.DEFAULT_CACHE_MAX_BYTES
+        )
+        # An explicit refresh interval caps the adaptive polling schedule
+        refresh_interval_seconds = payload.pop("refresh_interval_seconds", None)
+        self.poll_schedule = PollSchedule(
+            initial=payload_option(
+                payload,
+                config,
+                "poll_initial_seconds",
+                PollSchedule.DEFAULT_INITIAL_SECONDS,
+                float,
+            ),
+            factor=payload_option(
+                payload,
+                config,
+                "poll_backoff_factor",
+                PollSchedule.DEFAULT_BACKOFF_FACTOR,
+                float,
+            ),
+            maximum=float(
+                payload.pop(
+                    "poll_max_seconds",
+                    refresh_interval_seconds
+                    or config.get("poll_max_seconds", PollSchedule.DEFAULT_MAX_SECONDS),
+                )
+            ),
+            jitter=payload_option(
+                payload, config, "poll_jitter", PollSchedule.DEFAULT_JITTER, float
+            ),
+            use_elapsed=payload_option(
+                payload, config, "poll_use_elapsed", False, to_bool
+            ),
+        )
+        self.batch_monitor = config_bool(config, "batch_monitor", False)
+        self.monitor_websocket = payload_option(
+            payload, config, "monitor_websocket", False, to_bool
+        )
+        self.websocket_path = config.get("websocket_path", self.WEBSOCKET_PATH)
+
+    @staticmethod
+    def compile_filters(apply_filters):
+        """ Compile the JMESPath filters once so invalid expressions are
+            rejected when the payload is parsed
+        """
+        try:
+            if isinstance(apply_filters, dict):
+                return {
+                    key: compile_filter(jmes_filter)
+                    for key, jmes_filter in apply_filters.items()
+                }
+            if isinstance(apply_filters, str):
+                return compile_filter(apply_filters)
+        except JMESPathError as err:
+            raise Exception(f"Invalid apply_filter {apply_filters} {err}")
+        return None
 
     @classmethod
     def from_raw(cls, queue, payload, plugin_config, logger):
         """ Class method to create a new instance """
         return cls(queue, payload, plugin_config, logger)
 
+    def streaming_filter(self):
+        """ The per item filter used to stream the results, only a results
+            filter projecting each item, with no other filter looking at the
+            results, can be applied while streaming
+        """
+        if not isinstance(self.compiled_filters, dict):
+            return None
+        if "results" not in self.compiled_filters or any(
+            "results" in expression
+            for key, expression in self.apply_filters.items()
+            if key != "results"
+        ):
+            return None
+        item_filter = item_expression(self.compiled_filters["results"])
+        if item_filter is None:
+            self.logger.debug(
+                "Filter %s can't be streamed", self.apply_filters["results"]
+            )
+        return item_filter
+
+    def preview(self, value):
+        """ A value for a log message, only formatted and truncated when
+            the message is logged
+        """
+        return Preview(value, self.preview_size)
+
     def initialize_ssl(self):
         """ Configure SSL for the current session """
-        self.ssl_context = ssl.SSLContext()
         # if self.config.get('ca_file', None):
         #    self.ssl_context.load_verify_locations(ca_file=self.config['ca_file'])
         verify_ssl = self.config.get("verify_ssl", True)
         if isinstance(verify_ssl, str):
             verify_ssl = strtobool(verify_ssl)
 
-        if not verify_ssl:
-            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.ssl_context = RUNTIME.ssl_context(bool(verify_ssl))
 
-    async def get_page(self, session, url, params):
+    async def get_page(self, session, url, params, priority=None):
         """ Get a single page from the Tower API """
-        self.logger.debug(f"Making get request for {url} {params}")
-        async with session.get(url, params=params, ssl=self.ssl_context) as response:
-            response_text = dict(status=response.status, body=await response.text())
-        return response_text
+        response, _ = await self.fetch_page(session, url, params, priority=priority)
+        return response
+
+    async def fetch_page(
+        self, session, url, params, headers=None, reader=None, priority=None
+    ):
+        """ Get a single page from the Tower API along with its headers
+            Transient failures are retried with a backoff, so a crawl picks
+            up again from the page that failed. A successful body is read
+            with the reader when there is one
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            trial = self.check_breaker()
+            self.logger.debug("Making get request for %s %s", url, self.preview(params))
+            self.metrics.count("requests")
+            try:
+                async with self.throttle(priority):
+                    async with session.get(
+                        url,
+                        params=params,
+                        headers=headers,
+                        ssl=self.ssl_context,
+                        timeout=self.client_timeout,
+                        trace_request_ctx=self.metrics,
+                    ) as response:
+                        with self.metrics.time("read"):
+                            if reader is not None and response.status == 200:
+                                body = await reader(response)
+                            else:
+                                body = await response.text()
+                        response_text = dict(status=response.status, body=body)
+            except RETRY_ERRORS as err:
+                self.record_outcome(None)
+                delay = self.retry_delay(attempt, None)
+                if delay is None:
+                    raise
+                reason = err
+            else:
+                status = response_text["status"]
+                self.record_outcome(status)
+                delay = None
+                if status in RETRY_STATUSES:
+                    delay = self.retry_delay(
+                        attempt,
+                        retry_after_seconds(response.headers.get("Retry-After", None)),
+                    )
+                if delay is None:
+                    return response_text, response.headers
+                reason = f"status {status}"
+            finally:
+                if trial:
+                    self.breaker.finish_trial()
+
+            self.logger.warning(
+                "Get %s %s failed with %s, retrying in %.2fs",
+                url,
+                self.preview(params),
+                reason,
+                delay,
+            )
+            self.metrics.count("retries")
+            await asyncio.sleep(delay)
+
+    def check_breaker(self):
+        """ Fail fast when the circuit of the Tower is open, True when this
+            request is the trial let through after the reset period
+        """
+        if self.breaker is None:
+            return False
+        return self.breaker.check()
+
+    def record_outcome(self, status):
+        """ Let the circuit breaker know how a request went, None is a
+            connection failure
+        """
+        if self.breaker is None:
+            return
+        if status is None or status in FAILURE_STATUSES:
+            self.breaker.failure()
+        elif status not in RETRY_STATUSES:
+            self.breaker.success()
+
+    def retry_delay(self, attempt, retry_after):
+        """ Seconds to wait before retrying a failed request, None when it
+            should not be retried
+        """
+        if attempt > self.retries:
+            return None
+        if retry_after is not None and retry_after > self.retry_schedule.maximum:
+            return None
+        delay = max(self.retry_schedule.delay(attempt), retry_after or 0)
+        if (
+            self.deadline is not None
+            and asyncio.get_event_loop().time() + delay >= self.deadline
+        ):
+            return None
+        if self.breaker is not None and not self.breaker.budget.spend():
+            return None
+        return delay
+
+    async def read_results(self, response):
+        """ Parse a list response as it arrives, the results are projected
+            one at a time with the item filter
+        """
+        parser = ResultsParser(self.item_filter.search)
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")()
+        async for chunk in response.content.iter_chunked(self.STREAM_CHUNK_SIZE):
+            # The trace only sees the chunks of read and text
+            self.metrics.count("bytes_in", len(chunk))
+            parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode(b"", final=True))
+        return parser.close()
+
+    def throttle(self, priority=None):
+        """ Wait for the limiter of the Tower before sending a request, at
+            the priority of the run unless another one is given
+        """
+        return Throttle(self, priority)
+
+    async def get_cached_page(self, session, url, params):
+        """ Get a page through the response cache, identical requests in
+            flight at the same time share one response from Tower
+        """
+        if self.item_filter is not None:
+            # Streamed pages are projected as they arrive, there is no
+            # body left to cache or share
+            response, _ = await self.fetch_page(
+                session, url, params, reader=self.read_results
+            )
+            return response
+
+        key = RESPONSE_CACHE.key(url, params, session.headers.get("Authorization"))
+        priority = SharedPriority(self.priority)
+        response = await IN_FLIGHT.do(
+            key,
+            lambda: self.fetch_cached_page(session, key, url, params, priority),
+            priority,
+        )
+        return dict(response)
+
+    async def fetch_cached_page(self, session, key, url, params, priority=None):
+        """ Get a page, a cached page is served as is within the TTL and
+            revalidated with Tower after that
+        """
+        if not RESPONSE_CACHE.max_bytes:
+            return await self.get_page(session, url, params, priority)
+
+        entry = RESPONSE_CACHE.get(key)
+        if entry is not None and entry.age() < self.cache_ttl_seconds:
+            RESPONSE_CACHE.hits += 1
+            return dict(status=200, body=entry.body, cache=(key, entry))
+
+        response, headers = await self.fetch_page(
+            session,
+            url,
+            params,
+            entry.validators() if entry else None,
+            priority=priority,
+        )
+        if response["status"] == 304 and entry is not None:
+            RESPONSE_CACHE.revalidations += 1
+            entry.stored_at = time.monotonic()
+            return dict(status=200, body=entry.body, cache=(key, entry))
+
+        RESPONSE_CACHE.misses += 1
+        if response["status"] == 200:
+            entry = CacheEntry(
+                response["body"],
+                headers.get("ETag", None),
+                headers.get("Last-Modified", None),
+            )
+            if entry.validators() or self.cache_ttl_seconds > 0:
+                RESPONSE_CACHE.put(key, entry)
+                response["cache"] = (key, entry)
+        return response
 
     async def get(self, session, url):
         """ Send an HTTP Get request to the Ansible Tower API
             supports
             Fetching all pages from the end point using fetch_all_pages = True
             Compressing the response payload using accept_encoding = gzip
+            The pages are fetched and emitted in a pipeline, the next page is
+            already in flight while the current one is filtered, compressed
+            and sent in a worker thread.
          """
         url_info = urlparse(url)
         params = dict(parse_qsl(url_info.query))
         if isinstance(self.params, dict):
             params.update(self.params)
-        while True:
-            response = await self.get_page(session, url, params)
-            if response["status"] != 200:
-                raise Exception(
-                    f"Get failed {url} status {response['status']} body {response.get('body','empty')}"
-                )
-            json_body = json.loads(response["body"])
-            json_body = self.reconstitute_body(json_body)
-            response["body"] = json.dumps(json_body)
 
-            self.logger.debug(f"Response from filter {response}")
-            self.send_response(response)
+        pages = asyncio.Queue(maxsize=self.page_queue_depth)
+        producer = asyncio.ensure_future(self.fetch_pages(session, url, params, pages))
+        consumer = asyncio.ensure_future(self.emit_pages(pages))
+        try:
+            await asyncio.gather(producer, consumer)
+        finally:
+            producer.cancel()
+            consumer.cancel()
+
+    async def fetch_pages(self, session, url, params, pages):
+        """ Fetch the pages and put them on the bounded pages queue """
+        while True:
+            response = await self.get_cached_page(session, url, params)
+            json_body, page_info = self.parse_page(url, response)
+            if (
+                json_body is None
+                and self.fetch_all_pages
+                and self.page_concurrency > 1
+                and page_info.get("next", None)
+            ):
+                # The page size Tower used is only known from the results
+                page_info = self.decode(response["body"])
+            await pages.put((response, json_body))
+            await self.yield_page()
 
-            if self.fetch_all_pages:
-                if json_body.get("next", None):
-                    params["page"] = params.get("page", 1) + 1
-                else:
-                    break
+            if self.fetch_all_pages and page_info.get("next", None):
+                last_page = self.last_page(page_info)
+                if self.page_concurrency > 1 and last_page:
+                    page_info = await self.get_remaining_pages(
+                        session, url, params, last_page, pages
+                    )
+                    if not page_info.get("next", None):
+                        break
+                    # The collection grew since the first page was fetched
+                    params["page"] = last_page
+                params["page"] = int(params.get("page", 1)) + 1
             else:
                 break
+        await pages.put(None)
+
+    async def yield_page(self):
+        """ Let the other requests run between the pages of a bulk crawl """
+        if self.priority == BULK:
+            await asyncio.sleep(0)
+
+    async def emit_pages(self, pages):
+        """ Filter, encode and send the pages in order off the event loop """
+        loop = asyncio.get_event_loop()
+        while True:
+            page = await pages.get()
+            if page is None:
+                break
+            await loop.run_in_executor(None, self.emit_page, *page)
+        if self.coalescer is not None:
+            await loop.run_in_executor(None, self.coalescer.flush, True)
+
+    def last_page(self, json_body):
+        """ Compute the number of the last page from the count and the
+            number of results in the first page of a collection
+        """
+        count = json_body.get("count", None)
+        results = json_body.get("results", None)
+        if not isinstance(count, int) or not isinstance(results, list) or not results:
+            return None
+        return -(-count // len(results))
+
+    async def get_remaining_pages(self, session, url, params, last_page, pages):
+        """ Fetch the rest of the pages concurrently, at most page_concurrency
+            requests are in flight and the pages are queued in order.
+            Returns the paging info of the last page fetched
+        """
+        next_page = int(params.get("page", 1)) + 1
+        pending = collections.deque()
+        page_info = {}
+        try:
+            while pending or next_page <= last_page:
+                while next_page <= last_page and len(pending) < self.page_concurrency:
+                    pending.append(
+                        asyncio.ensure_future(
+                            self.get_cached_page(
+                                session, url, dict(params, page=next_page)
+                            )
+                        )
+                    )
+                    next_page += 1
+
+                response = await pending.popleft()
+                if response["status"] == 404:
+                    # The collection shrunk since the first page was fetched
+                    return {}
+                json_body, page_info = self.parse_page(url, response)
+                await pages.put((response, json_body))
+                await self.yield_page()
+        finally:
+            for task in pending:
+                task.cancel()
+        return page_info
+
+    def parse_page(self, url, response):
+        """ Check the status of a page and parse its body, returns the parsed
+            body and the paging info. When the body can be passed through
+            untouched only the paging info is extracted and the body is None
+        """
+        if response["status"] != 200:
+            raise Exception(
+                f"Get failed {url} status {response['status']} body {response.get('body','empty')}"
+            )
+        if isinstance(response["body"], dict):
+            # Streamed and projected already
+            return response["body"], response["body"]
+        if self.passthrough(response["body"]) or self.cached_filtered(response):
+            return None, self.page_info(response["body"])
+        json_body = self.decode(response["body"])
+        return json_body, json_body
+
+    def cached_filtered(self, response):
+        """ The filtered body of a cached page, if it was filtered before """
+        if "cache" not in response or self.coalescer is not None:
+            return None
+        _, entry = response["cache"]
+        return entry.filtered.get(self.filter_key, None)
+
+    def passthrough(self, body):
+        """ A body can be forwarded as is when it needs no filtering and
+            has no artifacts to be trimmed
+        """
+        return (
+            not self.apply_filters
+            and self.coalescer is None
+            and self.method != "sync"
+            and '"artifacts"' not in body
+        )
+
+    def page_info(self, body):
+        """ Extract the count and next keys without parsing the whole body,
+            Tower sends these top level keys ahead of the results
+        """
+        results_index = body.find('"results"')
+        if results_index < 0:
+            return {}
+        head = body[:results_index]
+        page_info = {}
+        match = self.NEXT_PATTERN.search(head)
+        if match:
+            page_info["next"] = json.loads(match.group(1))
+        match = self.COUNT_PATTERN.search(head)
+        if match:
+            page_info["count"] = int(match.group(1))
+        return page_info
+
+    def emit_page(self, response, json_body):
+        """ Filter a page and send it to the response queue, the unfiltered
+            body is left untouched so the paging info is always available
+        """
+        self.metrics.count("pages")
+        filtered = self.cached_filtered(response)
+        key, entry = response.pop("cache", (None, None))
+        if self.coalescer is not None:
+            self.coalesce_page(json_body)
+            return
+
+        if filtered is not None:
+            response["body"] = filtered
+        elif json_body is not None:
+            response["body"] = self.encode(self.reconstitute_body(dict(json_body)))
+            if entry is not None:
+                RESPONSE_CACHE.put_filtered(
+                    key, entry, self.filter_key, response["body"]
+                )
+
+        self.logger.debug("Response from filter %s", self.preview(response))
+        self.send_response(response)
+
+    def sync_page(self, json_body):
+        """ Drop the objects of a sync page that were already seen and move
+            the cursor past the others
+        """
+        results = []
+        for item in json_body.get("results", []):
+            position = (item.get("modified", ""), item.get("id", 0))
+            if position > self.sync_position:
+                results.append(item)
+                self.sync_position = position
+        self.sync_changed += len(results)
+        return dict(json_body, results=results)
+
+    def coalesce_page(self, json_body):
+        """ Hand the filtered results of a page to the coalescer """
+        body = self.reconstitute_body(dict(json_body))
+        results = body.get("results", None) if isinstance(body, dict) else body
+        if not isinstance(results, list):
+            results = [body]
+        self.coalescer.add(json_body.get("count", None), results)
 
     def reconstitute_body(self, json_body):
-        if self.apply_filters:
-            json_body = self.filter_body(json_body)
+        with self.metrics.time("filter"):
+            if self.apply_filters:
+                json_body = self.filter_body(json_body)
 
-        if isinstance(json_body.get("artifacts", None), dict):
-            json_body = self.filter_artifacts(json_body)
+            if isinstance(json_body.get("artifacts", None), dict):
+                json_body = self.filter_artifacts(json_body)
 
         return json_body
 
+    def decode(self, body):
+        """ Parse a JSON body from Tower """
+        with self.metrics.time("parse"):
+            return self.codec.loads(body)
+
+    def encode(self, value):
+        """ Encode a filtered body as JSON """
+        with self.metrics.time("encode"):
+            return self.codec.dumps(value)
+
     def send_response(self, response):
-        if self.encoding and self.encoding == "gzip":
-            self.result_queue.put(self.zip_json_contents(response))
+        """ Send the response, compressing it when the body is big enough """
+        if self.timed_out and "timed_out" not in response:
+            # A page that was still being emitted when the deadline passed
+            return
+        response.update(self.tag)
+        if self.limiter is not None and self.limiter.configured:
+            response["queue_wait_seconds"] = round(self.queue_wait_seconds, 6)
+        if self.include_timings:
+            response["timings"] = self.metrics.snapshot()
+        if (
+            self.encoding in self.COMPRESSED_ENCODINGS
+            and len(response["body"]) >= self.gzip_min_size
+        ):
+            message = self.zip_json_contents(response)
+            self.metrics.count("bytes_out", len(message))
         else:
-            self.result_queue.put(response)
+            message = response
+            self.metrics.count("bytes_out", len(response["body"]))
+        with self.metrics.time("queue_put"):
+            self.result_queue.put(message)
 
     def zip_json_contents(self, data):
-        """ Compress the data using gzip """
-        self.logger.debug(f"Compressing response data for URL {self.href_slug}")
-        return gzip.compress(json.dumps(data).encode("utf-8"))
+        """ Compress the data using gzip or a zlib preset dictionary
+            With gzip_raw and zdict the body, which already is JSON, is
+            embedded as is instead of being escaped into a string a second
+            time and the body_encoding key is set to json
+        """
+        self.logger.debug("Compressing response data for URL %s", self.href_slug)
+        if self.encoding in ("gzip_raw", "zdict") and data["body"].strip():
+            extra = {
+                key: value
+                for key, value in data.items()
+                if key not in ("status", "body")
+            }
+            document = raw_body_document(data["status"], data["body"], **extra)
+        else:
+            document = self.encode(data)
+        with self.metrics.time("compress"):
+            if self.encoding == "zdict":
+                return zdict.compress(document.encode("utf-8"), level=self.gzip_level)
+            return gzip.compress(
+                document.encode("utf-8"), compresslevel=self.gzip_level
+            )
 
     def filter_body(self, json_body):
         """ Apply JMESPath filters to the json body"""
-        self.logger.debug(f"Filtering response data for URL {self.href_slug}")
-        if isinstance(self.apply_filters, dict):
-            for key, jmes_filter in self.apply_filters.items():
-                json_body[key] = jmespath.search(jmes_filter, json_body)
-        elif isinstance(self.apply_filters, str):
-            json_body = jmespath.search(self.apply_filters, json_body)
+        self.logger.debug("Filtering response data for URL %s", self.href_slug)
+        if isinstance(self.compiled_filters, dict):
+            for key, jmes_filter in self.compiled_filters.items():
+                if key == "results" and self.item_filter is not None:
+                    # Projected while streaming, a projection drops nulls
+                    results = json_body.get(key, None)
+                    if results is not None:
+                        results = [item for item in results if item is not None]
+                    json_body[key] = results
+                    continue
+                json_body[key] = jmes_filter.search(json_body)
+        elif self.compiled_filters is not None:
+            json_body = self.compiled_filters.search(json_body)
 
         return json_body
 
     def filter_artifacts(self, json_body):
+        """ Keep the artifacts exposed to cloud.redhat.com, the size of their
+            encoding is added up one artifact at a time and the filtering
+            stops as soon as it is over max_artifacts_size
+        """
         artifacts = {}
-        for key in json_body["artifacts"]:
-            if key.startswith(self.ARTIFACTS_KEY_PREFIX):
-                artifacts[key] = json_body["artifacts"][key]
-
-        if len(json.dumps(artifacts)) > self.MAX_ARTIFACTS_SIZE:
-            raise Exception(f"Artifacts is over {self.MAX_ARTIFACTS_SIZE} bytes")
+        size = len("{}")
+        for key, value in json_body["artifacts"].items():
+            if not key.startswith(self.ARTIFACTS_KEY_PREFIX):
+                continue
+            # "key": value and the ", " separating it from the previous one
+            size += encoded_size(key, self.max_artifacts_size) + len(": ")
+            size += len(", ") if artifacts else 0
+            value_size = encoded_size(value, self.max_artifacts_size - size)
+            size += value_size
+            if size > self.max_artifacts_size:
+                kept = ", ".join(artifacts) or "none"
+                raise Exception(
+                    f"Artifacts is over {self.max_artifacts_size} bytes, it went over "
+                    f"at {key} taking at least {value_size} bytes, artifacts before it: {kept}"
+                )
+            artifacts[key] = value
 
         json_body["artifacts"] = artifacts
         return json_body
 
     async def monitor(self, session, url):
         """ Monitor a Ansible Tower Job """
-        self.logger.debug(f"Monitor Job {url} data {self.params}")
+        self.logger.debug("Monitor Job %s data %s", url, self.preview(self.params))
         url_info = urlparse(url)
         params = dict(parse_qsl(url_info.query))
         if isinstance(self.params, dict):
             params.update(self.params)
+
+        polls = 0
+        match = self.JOB_URL_PATTERN.match(url_info.path)
+        if self.monitor_websocket and match and not params:
+            try:
+                polls = await self.wait_for_status_event(
+                    session, url, int(match.group(2))
+                )
+                match = None
+            except asyncio.CancelledError:
+                # An Exception before Python 3.8, the deadline has to stop the run
+                raise
+            except Exception as err:  # pylint: disable=broad-except
+                self.logger.warning(
+                    "Websocket monitoring of %s failed, falling back to polling %s",
+                    url,
+                    err,
+                )
+
+        if self.batch_monitor and match and not params:
+            # Wait on the shared batched polling, then get the job once
+            _, polls = await MONITORS.wait(
+                session,
+                urljoin(url, match.group(1)),
+                int(match.group(2)),
+                self.poll_schedule,
+                functools.partial(self.get_page, session),
+            )
+
         while True:
             response = await self.get_page(session, url, params)
+            polls += 1
             if response["status"] != 200:
                 raise Exception(
                     f"Get failed {url} status {response['status']} body {response.get('body','empty')}"
                 )
 
-            json_body = json.loads(response["body"])
+            json_body = self.decode(response["body"])
             if json_body["status"] not in self.JOB_COMPLETION_STATUSES:
-                await asyncio.sleep(self.refresh_interval_seconds)
+                await asyncio.sleep(self.poll_schedule.delay(polls, json_body))
                 continue
 
-            json_body = self.reconstitute_body(json_body)
-            response["body"] = json.dumps(json_body)
+            if not self.passthrough(response["body"]):
+                json_body = self.reconstitute_body(json_body)
+                response["body"] = self.encode(json_body)
 
-            self.logger.debug(f"Response from filter {response}")
+            response["polls"] = polls
+            self.logger.debug("Response from filter %s", self.preview(response))
             self.send_response(response)
             break
 
-    async def post(self, session, url):
-        """ Post the data to the Ansible Tower """
-        self.logger.debug(f"Making post request for {url} data {self.params}")
-        headers = {"Content-Type": "application/json"}
-        async with session.post(
-            url, data=json.dumps(self.params), headers=headers, ssl=self.ssl_context
-        ) as post_response:
-            response = dict(
-                status=post_response.status, body=await post_response.text()
+    async def wait_for_status_event(self, session, url, job_id):
+        """ Wait for the job to complete using the status_changed events
+            of the Tower websocket. Tower accepts the socket with an accept
+            message and answers the subscription with the groups joined,
+            an error or any other reply fails the wait so the caller falls
+            back to polling. The job is checked after subscribing and again
+            whenever no event arrived within the poll schedule, the number
+            of polls is returned
+        """
+        url_info = urlparse(urljoin(url, self.websocket_path))
+        websocket_url = url_info._replace(
+            scheme="wss" if url_info.scheme == "https" else "ws"
+        ).geturl()
+        websocket_session = RUNTIME.websocket_session(
+            url, self.auth_headers(), self.config
+        )
+        async with websocket_session.ws_connect(
+            websocket_url, ssl=self.ssl_context, heartbeat=self.WEBSOCKET_HEARTBEAT
+        ) as websocket:
+            reply = await self.websocket_reply(websocket, self.WEBSOCKET_REPLY_SECONDS)
+            if not reply.get("accept", False):
+                raise Exception(f"Websocket {websocket_url} not accepted {reply}")
+
+            subscription = {"groups": {"jobs": ["status_changed"]}}
+            xrftoken = self.xrftoken(session, url)
+            if xrftoken:
+                subscription["xrftoken"] = xrftoken
+            await websocket.send_str(self.codec.dumps(subscription))
+            reply = await self.websocket_reply(websocket, self.WEBSOCKET_REPLY_SECONDS)
+            if "groups_current" not in reply and "groups_joined" not in reply:
+                raise Exception(
+                    f"Websocket {websocket_url} subscription failed {reply}"
+                )
+
+            polls = 0
+            while True:
+                response = await self.get_page(session, url, {})
+                polls += 1
+                if response["status"] != 200:
+                    raise Exception(
+                        f"Get failed {url} status {response['status']} body {response.get('body','empty')}"
+                    )
+                job = self.decode(response["body"])
+                if job["status"] in self.JOB_COMPLETION_STATUSES:
+                    return polls
+                if await self.status_event(
+                    websocket, job_id, self.poll_schedule.delay(polls, job)
+                ):
+                    return polls
+
+    async def status_event(self, websocket, job_id, timeout):
+        """ Wait up to timeout seconds for the terminal status event of the
+            job, returns False when none arrived in time
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                event = await self.websocket_reply(websocket, remaining)
+            except asyncio.TimeoutError:
+                return False
+            if (
+                event.get("unified_job_id", None) == job_id
+                and event.get("status", None) in self.JOB_COMPLETION_STATUSES
+            ):
+                return True
+
+    async def websocket_reply(self, websocket, timeout):
+        """ Receive the next JSON object from the websocket, an error reply
+            or a closed socket raise
+        """
+        message = await websocket.receive(timeout=timeout)
+        if message.type != aiohttp.WSMsgType.TEXT:
+            raise Exception(f"Websocket closed before the job completed {message}")
+        reply = self.codec.loads(message.data)
+        if not isinstance(reply, dict):
+            raise Exception(f"Unexpected websocket message {message.data}")
+        if "error" in reply:
+            raise Exception(f"Websocket error {reply['error']}")
+        return reply
+
+    @staticmethod
+    def xrftoken(session, url):
+        """ Tower only lets a socket join groups with the CSRF token of its
+            session cookie, a token authenticated session has none
+        """
+        cookie = session.cookie_jar.filter_cookies(url).get("csrftoken")
+        return cookie.value if cookie is not None else None
+
+    async def sync(self, session, url):
+        """ Send the objects of a collection modified since the cursor
+            The changed objects are fetched one page at a time ordered by
+            modified and id, each page is queried past the last object seen
+            so objects modified during the sync don't shift the pages. The
+            last message has the new cursor, holding the modified and id of
+            the last object and the count of the collection. Deletions are
+            detected by counting, only when the count is short of the last
+            count plus the objects created since, the ids of the collection
+            are listed.
+        """
+        base_params = dict(self.params) if isinstance(self.params, dict) else {}
+        loop = asyncio.get_event_loop()
+        ties = after = False
+        while True:
+            modified, last_id = self.sync_position
+            params = dict(base_params, order_by=self.SYNC_ORDER)
+            if ties:
+                params.update(modified=modified, id__gt=last_id, order_by="id")
+            elif after:
+                params["modified__gt"] = modified
+            elif modified:
+                params["modified__gte"] = modified
+            response = await self.get_page(session, url, params)
+            json_body = self.sync_page(self.parse_page(url, response)[0])
+            if json_body["results"]:
+                await loop.run_in_executor(None, self.emit_page, response, json_body)
+            more = bool(json_body.get("next", None))
+            if ties:
+                # Past the objects modified at the cursor time
+                ties, after = more, not more
+            elif not more:
+                break
+            else:
+                # A page full of objects modified at the cursor time is
+                # drained by id before moving on
+                ties = not after and not json_body["results"]
+                after = False
+        if self.coalescer is not None:
+            await loop.run_in_executor(None, self.coalescer.flush, True)
+
+        modified, last_id = self.sync_position
+        count = await self.collection_count(session, url, base_params)
+        result = dict(
+            cursor=dict(modified=modified or None, id=last_id or None, count=count),
+            changed=self.sync_changed,
+        )
+        if self.cursor.get("modified") and self.cursor.get("count") is not None:
+            created = await self.collection_count(
+                session, url, dict(base_params, created__gt=self.cursor["modified"])
+            )
+            if self.cursor["count"] + created > count:
+                result["ids"] = await self.list_ids(session, url, base_params)
+
+        self.send_response(
+            dict(status=200, body=self.codec.dumps(result), sync_complete=True)
+        )
+
+    async def collection_count(self, session, url, params):
+        """ The number of objects in a collection, fetching a single one """
+        response = await self.get_page(session, url, dict(params, page_size=1))
+        if response["status"] != 200:
+            raise Exception(
+                f"Get failed {url} status {response['status']} body {response.get('body','empty')}"
             )
+        return self.page_info(response["body"]).get("count", 0)
 
-            if response["status"] not in self.VALID_POST_CODES:
+    async def list_ids(self, session, url, params):
+        """ The ids of all the objects in a collection, each page is queried
+            past the last id so deletions don't shift the pages
+        """
+        ids = []
+        params = dict(params, order_by="id", page_size=self.SYNC_ID_PAGE_SIZE)
+        while True:
+            response = await self.get_page(session, url, params)
+            if response["status"] != 200:
                 raise Exception(
-                    f"Post failed {url} status {response['status']} body {response.get('body', 'empty')}"
+                    f"Get failed {url} status {response['status']} body {response.get('body','empty')}"
                 )
+            json_body = self.codec.loads(response["body"])
+            ids.extend(item["id"] for item in json_body.get("results", []))
+            if not json_body.get("next", None) or not ids:
+                return ids
+            params["id__gt"] = ids[-1]
+
+    async def post(self, session, url):
+        """ Post the data to the Ansible Tower """
+        self.logger.debug(
+            "Making post request for %s data %s", url, self.preview(self.params)
+        )
+        headers = {"Content-Type": "application/json"}
+        # A post isn't idempotent so it is never retried
+        trial = self.check_breaker()
+        self.metrics.count("requests")
+        try:
+            async with self.throttle():
+                async with session.post(
+                    url,
+                    data=self.codec.dumps(self.params),
+                    headers=headers,
+                    ssl=self.ssl_context,
+                    timeout=self.client_timeout,
+                    trace_request_ctx=self.metrics,
+                ) as post_response:
+                    with self.metrics.time("read"):
+                        response = dict(
+                            status=post_response.status,
+                            body=await post_response.text(),
+                        )
+        except RETRY_ERRORS:
+            self.record_outcome(None)
+            raise
+        else:
+            self.record_outcome(response["status"])
+        finally:
+            if trial:
+                self.breaker.finish_trial()
+
+        if response["status"] not in self.VALID_POST_CODES:
+            raise Exception(
+                f"Post failed {url} status {response['status']} body {response.get('body', 'empty')}"
+            )
 
-            json_body = json.loads(response["body"])
+        if not self.passthrough(response["body"]):
+            json_body = self.decode(response["body"])
             json_body = self.reconstitute_body(json_body)
-            response["body"] = json.dumps(json_body)
+            response["body"] = self.encode(json_body)
 
-            self.logger.debug(f"Response from filter {response}")
-            self.send_response(response)
+        self.logger.debug("Response from filter %s", self.preview(response))
+        self.send_response(response)
 
     def auth_headers(self):
         """ Create proper authentication headers based on Basic Auth or Token """
@@ -233,32 +1204,136 @@ class Run:
         return headers
 
     async def start(self):
-        """ Start the asynchronous process to send requests to the tower api """
+        """ Start the asynchronous process to send requests to the tower api
+            and hand the metrics of the run to the sinks when it is over
+        """
+        for sink in self.sinks:
+            try:
+                await sink.prepare()
+            except Exception as err:  # pylint: disable=broad-except
+                self.logger.warning("Metrics sink %s failed to prepare: %s", sink, err)
+        try:
+            await self.execute()
+        finally:
+            self.metrics.finish()
+            if self.sinks:
+                REGISTRY.record(self.metrics)
+            loop = asyncio.get_event_loop()
+            for sink in self.sinks:
+                try:
+                    await loop.run_in_executor(None, sink.emit, self.metrics)
+                except Exception as err:  # pylint: disable=broad-except
+                    self.logger.warning("Metrics sink %s failed: %s", sink, err)
+
+    async def execute(self):
+        """ Send the request, within the timeout when there is one """
         url = urljoin(self.config["url"], self.href_slug)
 
         if url.startswith("https"):
             self.initialize_ssl()
 
-        async with aiohttp.ClientSession(headers=self.auth_headers()) as session:
-            if self.method == "get":
-                await self.get(session, url)
-            elif self.method == "post":
-                await self.post(session, url)
-            elif self.method == "monitor":
-                await self.monitor(session, url)
+        session = RUNTIME.session(url, self.auth_headers(), self.config)
+        self.limiter = LIMITERS.limiter(url, self.config)
+        self.breaker = BREAKERS.breaker(url, self.config)
+        if self.timeout_seconds is None:
+            await self.dispatch(session, url)
+            return
 
+        loop = asyncio.get_event_loop()
+        self.deadline = loop.time() + self.timeout_seconds
+        task = asyncio.ensure_future(self.dispatch(session, url))
+        done, _ = await asyncio.wait([task], timeout=self.timeout_seconds)
+        if done:
+            task.result()
+            return
 
-def run(coroutine):
-    """ Run the worker """
-    loop = asyncio.new_event_loop()
-    loop.run_until_complete(coroutine)
-    # This hack is the recommended approach for graceful shutdown
-    # https://docs.aiohttp.org/en/stable/client_advanced.html#graceful-shutdown
-    # https://github.com/aio-libs/aiohttp/issues/1925
-    # Without this hack in place sockets go into CLOSE_WAIT state
-    loop.run_until_complete(asyncio.sleep(0.250))
+        self.timed_out = True
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.logger.warning(
+            "%s %s did not complete within %ss", self.method, url, self.timeout_seconds
+        )
+        self.send_response(self.timeout_response())
+
+    async def dispatch(self, session, url):
+        """ Send the request for the method of the payload """
+        if self.method == "get":
+            await self.get(session, url)
+        elif self.method == "post":
+            await self.post(session, url)
+        elif self.method == "monitor":
+            await self.monitor(session, url)
+        elif self.method == "sync":
+            await self.sync(session, url)
+
+    @staticmethod
+    def error_response(err):
+        """ The response sent for a request of a batch that failed """
+        return dict(status=500, body=json.dumps(dict(detail=str(err))), failed=True)
+
+    def timeout_response(self):
+        """ The response sent when the deadline of the payload passed """
+        detail = dict(
+            detail=f"Request did not complete within {self.timeout_seconds} seconds",
+            method=self.method,
+            href_slug=self.href_slug,
+        )
+        return dict(status=504, body=self.codec.dumps(detail), timed_out=True)
+
+
+class Batch:
+    """ A list of independent requests sent in one message, they run
+        concurrently on the pooled sessions and every response is tagged
+        with the index, and the id when there is one, of its request
+    """
 
-    return loop.close()
+    def __init__(self, queue, payloads, config, logger):
+        self.result_queue = queue
+        self.payloads = payloads
+        self.config = config
+        self.logger = logger
+
+    @classmethod
+    def from_raw(cls, queue, payloads, plugin_config, logger):
+        """ Class method to create a new instance """
+        return cls(queue, payloads, plugin_config, logger)
+
+    async def start(self):
+        """ Run all the requests, their responses are sent as they complete """
+        await asyncio.gather(
+            *[
+                self.start_request(index, payload)
+                for index, payload in enumerate(self.payloads)
+            ]
+        )
+
+    async def start_request(self, index, payload):
+        """ Run one request, a failure is sent as its response instead of
+            failing the other requests
+        """
+        tag = dict(index=index)
+        instance = None
+        try:
+            if not isinstance(payload, dict):
+                raise Exception(f"Batch entry {index} is not a request")
+            if "id" in payload:
+                tag["id"] = payload.pop("id")
+            instance = Run.from_raw(
+                self.result_queue, payload, self.config, self.logger
+            )
+            instance.tag = tag
+            await instance.start()
+        except Exception as err:  # pylint: disable=broad-except
+            self.logger.exception(err)
+            if instance is None:
+                self.result_queue.put(dict(Run.error_response(err), **tag))
+            else:
+                instance.send_response(instance.error_response(err))
+
+
+def run(coroutine):
+    """ Run the worker on the shared background event loop """
+    return RUNTIME.run(coroutine)
 
 
 @receptor_export
@@ -270,29 +1345,38 @@ def execute(message, config, queue):
                             href_slug:
                             accept_encoding:
                             params:
-                            method: get|post
+                            method: get|post|monitor
+                        or a list of such payloads run concurrently
+                        each with an optional id
         :param config: is the parameters loaded from the receptor.conf for this worker.
         :param queue: is the response channel used to send messages back to the receptor.
                       which forwards it to the platform controller.
     """
     logger = configure_logger()
     logger.debug(
-        "Payload Type: %s Data %s", type(message.raw_payload), message.raw_payload
+        "Payload Type: %s Data %s",
+        type(message.raw_payload),
+        Preview(message.raw_payload),
     )
 
     if isinstance(message.raw_payload, str):
         try:
-            payload = json.loads(message.raw_payload)
+            payload = get_codec(config.get("json_backend", "auto")).loads(
+                message.raw_payload
+            )
         except json.JSONDecodeError as err:
             logger.exception(err)
             raise
     else:
         payload = message.raw_payload
 
-    logger.debug("Parsed payload: %s", payload)
+    logger.debug("Parsed payload: %s", Preview(payload))
     try:
         logger.debug("Start called")
-        run(Run.from_raw(queue, payload, config, logger).start())
+        if isinstance(payload, list):
+            run(Batch.from_raw(queue, payload, config, logger).start())
+        else:
+            run(Run.from_raw(queue, payload, config, logger).start())
         logger.debug("Start finished")
     except Exception as err:
         logger.exception(err)
@@ -0,0 +1,94 @@
+"""
+  Compression with a zlib preset dictionary tuned for Tower API payloads
+  Small Tower objects compress poorly with plain gzip since there is no
+  shared context, a preset dictionary built from representative Tower
+  responses gives zlib that context up front.
+
+  A compressed payload is laid out as
+      MAGIC (2 bytes) | dictionary version (1 byte) | zlib stream
+  The dictionaries are shipped with the package and never change once
+  released, a new dictionary gets a new version.
+
+  zdict is experimental, the version 1 dictionary is built from the
+  synthetic responses of benchmarks/tower_data.py and will be replaced
+  by one built from real Tower captures. Until then the dictionaries in
+  EXPERIMENTAL_VERSIONS can still change and zdict has to be enabled
+  with zdict_experimental=True in receptor.conf
+"""
+import collections
+import os
+import re
+import zlib
+
+MAGIC = b"ZD"
+VERSION = 1
+EXPERIMENTAL_VERSIONS = [1]
+DICTIONARY_SIZE = 32 * 1024
+DICTIONARY_DIR = os.path.join(os.path.dirname(__file__), "dictionaries")
+FRAGMENT_PATTERN = re.compile(rb"[^,\d]+,?")
+MIN_FRAGMENT_SIZE = 4
+
+_dictionaries = {}
+
+
+def dictionary_path(version):
+    """ Path of the dictionary file shipped for a version """
+    return os.path.join(DICTIONARY_DIR, f"tower_v{version}.zdict")
+
+
+def load_dictionary(version=VERSION):
+    """ Load a shipped dictionary, they are cached once loaded """
+    if version not in _dictionaries:
+        try:
+            with open(dictionary_path(version), "rb") as dictionary_file:
+                _dictionaries[version] = dictionary_file.read()
+        except FileNotFoundError:
+            raise Exception(f"Unknown zdict dictionary version {version}")
+    return _dictionaries[version]
+
+
+def is_zdict(data):
+    """ Check if the data was compressed with a preset dictionary """
+    return isinstance(data, bytes) and data[:2] == MAGIC
+
+
+def compress(data, level=6, version=VERSION):
+    """ Compress the bytes with the preset dictionary """
+    compressor = zlib.compressobj(level, zdict=load_dictionary(version))
+    return MAGIC + bytes([version]) + compressor.compress(data) + compressor.flush()
+
+
+def decompress(data):
+    """ Decompress bytes created by compress """
+    if not is_zdict(data):
+        raise Exception("Data was not compressed with a zdict dictionary")
+    decompressor = zlib.decompressobj(zdict=load_dictionary(data[2]))
+    return decompressor.decompress(data[3:]) + decompressor.flush()
+
+
+def build_dictionary(samples, size=DICTIONARY_SIZE):
+    """ Build a preset dictionary from sample payloads
+        The samples are split into fragments at commas and digits, so ids
+        and counts don't make otherwise identical fragments differ. The
+        fragments found in the most samples, weighed by their length, make
+        up the dictionary with the most valuable ones at the end where zlib
+        reaches them with the shortest distances.
+    """
+    counts = collections.Counter()
+    for sample in samples:
+        counts.update(
+            fragment
+            for fragment in set(FRAGMENT_PATTERN.findall(sample))
+            if len(fragment) >= MIN_FRAGMENT_SIZE
+        )
+
+    chosen = []
+    total = 0
+    ranked = sorted(counts.items(), key=lambda item: (item[1] * len(item[0]), item[0]))
+    for fragment, count in reversed(ranked):
+        if count < 2 or total + len(fragment) > size:
+            continue
+        chosen.append(fragment)
+        total += len(fragment)
+
+    return b"".join(reversed(chosen))
@@ -16,6 +16,7 @@ setup(
     url="https://github.com/mkanoor/receptor-catalog",
     license="Apache",
     packages=find_packages(),
+    package_data={"receptor_catalog": ["dictionaries/*.zdict"]},
     description="Receptor plugin to communicate with Ansible Tower API",
     long_description=long_description,
     long_description_content_type="text/markdown",
@@ -24,5 +25,9 @@ setup(
     zip_safe=False,
     entry_points={"receptor.worker": "receptor_catalog = receptor_catalog.worker"},
     classifiers=["Programming Language :: Python :: 3"],
-    extras_require={"dev": ["pytest", "flake8", "pylint", "black"]},
+    extras_require={
+        "dev": ["pytest", "flake8", "pylint", "black"],
+        "orjson": ["orjson"],
+        "ujson": ["ujson"],
+    },
 )
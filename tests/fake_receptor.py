@@ -0,0 +1,40 @@
+""" The receptor side of the tests, sending messages to the plugin """
+import json
+import queue
+from aioresponses import aioresponses
+from receptor_catalog import worker
+from test_data import TestData
+
+
+class FakeMessage:
+    """ Class to create a Fake Message, that is sent from the receptor
+        to the plugin
+    """
+
+    raw_payload = None
+
+
+def list_body(*results):
+    """ A single page list response """
+    return json.dumps(dict(count=1, next=None, previous=None, results=list(results)))
+
+
+def run_filtered_get(config=None, body=None, **options):
+    """ Run a filtered GET of the job templates returning the response """
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(
+            href_slug="api/v2/job_templates",
+            method="get",
+            params=dict(page_size=1),
+            apply_filter=dict(results="results[].{id: id, name:name}"),
+            **options,
+        )
+    )
+    if body is None:
+        body = list_body(TestData.JOB_TEMPLATE_1)
+    response_queue = queue.Queue()
+    with aioresponses() as mocked:
+        mocked.get(TestData.JOB_TEMPLATES_LIST_URL, status=200, body=body)
+        worker.execute(message, config or TestData.RECEPTOR_CONFIG, response_queue)
+    return response_queue.get()
@@ -0,0 +1,43 @@
+""" Tests for the GET response cache """
+from receptor_catalog.cache import CacheEntry, ResponseCache
+
+
+def test_cache_key_hides_credentials():
+    """ The credentials are part of the key only as a digest """
+    key = ResponseCache.key("https://tower/api/v2/jobs/", {"page": 1}, "Bearer secret")
+    other = ResponseCache.key("https://tower/api/v2/jobs/", {"page": 1}, "Bearer other")
+    assert key != other
+    assert "secret" not in str(key)
+
+
+def test_cache_evicts_least_recently_used():
+    """ The least recently used entries are evicted when over budget """
+    cache = ResponseCache(10)
+    cache.put("a", CacheEntry("aaaa", etag='"a"'))
+    cache.put("b", CacheEntry("bbbb", etag='"b"'))
+    cache.get("a")
+    cache.put("c", CacheEntry("cccc", etag='"c"'))
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.size == 8
+
+
+def test_cache_filtered_bodies_count_against_budget():
+    """ Filtered bodies are stored with their entry and evicted with it """
+    cache = ResponseCache(10)
+    entry = CacheEntry("aaaa", etag='"a"')
+    cache.put("a", entry)
+    cache.put_filtered("a", entry, "filter", "aa")
+    assert entry.filtered == {"filter": "aa"}
+    assert cache.size == 6
+    cache.put("b", CacheEntry("bbbbbb", last_modified="yesterday"))
+    assert list(cache.entries) == ["b"]
+
+
+def test_cache_entry_validators():
+    """ The validators are sent as conditional request headers """
+    entry = CacheEntry("body", etag='"v1"', last_modified="Tue, 01 Jan 2030")
+    assert entry.validators() == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Tue, 01 Jan 2030",
+    }
+    assert CacheEntry("body").validators() == {}
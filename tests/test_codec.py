@@ -0,0 +1,60 @@
+""" Test the JSON codecs """
+import json
+import pytest
+from receptor_catalog import codec
+from test_data import TestData
+
+
+@pytest.mark.parametrize("name", ["auto"] + sorted(codec.AVAILABLE_CODECS))
+def test_codec_matches_stdlib(name):
+    """ Every codec decodes the same documents as the json module and
+        encodes them to the same bytes
+    """
+    json_codec = codec.get_codec(name)
+    document = dict(TestData.JOB_TEMPLATES_PAGE1_RESPONSE, description="Fréd / Wilma")
+    encoded = json_codec.dumps(document)
+    assert isinstance(encoded, str)
+    assert encoded == json.dumps(document)
+    assert json_codec.loads(json.dumps(document)) == document
+
+
+@pytest.mark.parametrize("name", sorted(codec.AVAILABLE_CODECS))
+def test_compact_codec_round_trips(name):
+    """ The compact output of a backend decodes to the same document """
+    json_codec = codec.get_codec(name, compact=True)
+    document = dict(TestData.JOB_TEMPLATES_PAGE1_RESPONSE, description="Fréd / Wilma")
+    encoded = json_codec.dumps(document)
+    assert isinstance(encoded, str)
+    assert json.loads(encoded) == document
+
+
+@pytest.mark.parametrize("name", sorted(codec.AVAILABLE_CODECS))
+def test_codec_decode_error(name):
+    """ Every codec raises json.JSONDecodeError on bad input """
+    with pytest.raises(json.JSONDecodeError):
+        codec.get_codec(name).loads("fail string")
+
+
+def test_get_codec():
+    """ auto picks an installed codec, unknown backends are rejected """
+    assert codec.get_codec("auto").name in codec.AVAILABLE_CODECS
+    assert codec.get_codec("auto", compact=True) in codec.AVAILABLE_CODECS.values()
+    assert codec.get_codec("json") is codec.JSONCodec
+    with pytest.raises(Exception) as excinfo:
+        codec.get_codec("simdjson")
+    assert "JSON backend simdjson is not installed" in str(excinfo.value)
+
+
+def test_encoded_size():
+    """ The size matches json.dumps until it goes over the budget """
+    document = dict(TestData.JOB_TEMPLATES_PAGE1_RESPONSE, description="Fréd / Wilma")
+    size = len(json.dumps(document))
+    assert codec.encoded_size(document, size) == size
+    assert codec.encoded_size("Fréd", 100) == len(json.dumps("Fréd"))
+
+
+def test_encoded_size_stops_over_budget():
+    """ The encoding stops as soon as the budget is spent """
+    huge = dict(small=1, rows=[dict(row="x" * 100) for _ in range(100000)])
+    assert 100 < codec.encoded_size(huge, 100) < 300
+    assert codec.encoded_size("x" * 10 ** 6, 1024) == 10 ** 6 + 2
@@ -13,6 +13,9 @@ class TestData:
     JOB_TEMPLATES_LIST_URL_PAGE_2 = (
         "https://www.example.com/api/v2/job_templates?page=2&page_size=1"
     )
+    JOB_TEMPLATES_LIST_URL_PAGE_3 = (
+        "https://www.example.com/api/v2/job_templates?page=3&page_size=1"
+    )
     RECEPTOR_CONFIG = dict(
         username="fred",
         password="radia",
@@ -44,6 +47,20 @@ class TestData:
         apply_filter=dict(results="results[].{id: id, name:name}"),
         params=dict(page_size=1),
     )
+    JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_GZIPPED_RAW = dict(
+        href_slug="api/v2/job_templates",
+        method="get",
+        fetch_all_pages="False",
+        accept_encoding="gzip_raw",
+        params=dict(page_size=1),
+    )
+    JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_ZDICT = dict(
+        href_slug="api/v2/job_templates",
+        method="get",
+        fetch_all_pages="False",
+        accept_encoding="zdict",
+        params=dict(page_size=1),
+    )
     JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE = dict(
         href_slug="api/v2/job_templates",
         method="get",
@@ -56,6 +73,30 @@ class TestData:
         fetch_all_pages="True",
         params=dict(page_size=1),
     )
+    JOB_TEMPLATE_PAYLOAD_ALL_PAGES_CONCURRENT = dict(
+        href_slug="api/v2/job_templates",
+        method="get",
+        fetch_all_pages="True",
+        page_concurrency=2,
+        params=dict(page_size=1),
+    )
+    JOB_TEMPLATE_PAYLOAD_ALL_PAGES_PIPELINED = dict(
+        href_slug="api/v2/job_templates",
+        method="get",
+        fetch_all_pages="True",
+        page_concurrency=1,
+        page_queue_depth=1,
+        params=dict(page_size=1),
+    )
+    JOB_TEMPLATE_PAYLOAD_ALL_PAGES_COALESCED = dict(
+        href_slug="api/v2/job_templates",
+        method="get",
+        fetch_all_pages="True",
+        coalesce_pages="True",
+        coalesce_max_items=2,
+        apply_filter=dict(results="results[].{id: id, name:name}"),
+        params=dict(page_size=1),
+    )
     JOB_TEMPLATE_COUNT = 3
     JOB_TEMPLATE_1 = dict(
         id=JOB_TEMPLATE_ID_1, type="job_template", name="Fred Flintstone"
@@ -84,6 +125,27 @@ class TestData:
         count=JOB_TEMPLATE_COUNT, next=None, previous=None, results=[JOB_TEMPLATE_3],
     )
 
+    JOB_TEMPLATES_PAGES_OF_ONE_RESPONSES = [
+        dict(
+            count=JOB_TEMPLATE_COUNT,
+            next="/api/v2/job_templates/?page=2&page_size=1",
+            previous=None,
+            results=[JOB_TEMPLATE_1],
+        ),
+        dict(
+            count=JOB_TEMPLATE_COUNT,
+            next="/api/v2/job_templates/?page=3&page_size=1",
+            previous="/api/v2/job_templates/?page=1&page_size=1",
+            results=[JOB_TEMPLATE_2],
+        ),
+        dict(
+            count=JOB_TEMPLATE_COUNT,
+            next=None,
+            previous="/api/v2/job_templates/?page=2&page_size=1",
+            results=[JOB_TEMPLATE_3],
+        ),
+    ]
+
     JOB_TEMPLATE_POST_URL = "https://www.example.com/api/v2/job_templates/909/launch"
     JOB_TEMPLATE_POST_PAYLOAD = dict(
         href_slug="api/v2/job_templates/909/launch",
@@ -0,0 +1,160 @@
+""" Test the per Tower request limits """
+import asyncio
+import time
+from receptor_catalog.limiter import (
+    BULK,
+    INTERACTIVE,
+    LIMITERS,
+    HostLimiter,
+    SharedPriority,
+    TokenBucket,
+)
+
+
+def test_token_bucket_paces_after_burst():
+    """ The burst is available at once and then the tokens come at the rate """
+    bucket = TokenBucket(rate=10, burst=2)
+    delays = []
+    for _ in range(2):
+        delays.append(bucket.delay())
+        bucket.take()
+    assert delays == [0, 0]
+    assert 0.09 < bucket.delay() <= 0.1
+
+
+def test_limiter_serves_interactive_first():
+    """ Interactive requests get the slots ahead of the waiting bulk ones """
+    order = []
+
+    async def request(limiter, name, priority):
+        async with limiter.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        limiter = HostLimiter(max_in_flight=1)
+        bulk = [
+            asyncio.ensure_future(request(limiter, f"page{page}", BULK))
+            for page in range(3)
+        ]
+        await asyncio.sleep(0.005)
+        interactive = asyncio.ensure_future(request(limiter, "launch", INTERACTIVE))
+        await asyncio.gather(interactive, *bulk)
+
+    asyncio.new_event_loop().run_until_complete(main())
+    assert order == ["page0", "launch", "page1", "page2"]
+
+
+def test_limiter_raises_shared_priority_while_waiting():
+    """ A waiting request moves ahead when its priority is raised """
+    order = []
+
+    async def request(limiter, name, priority):
+        async with limiter.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        limiter = HostLimiter(max_in_flight=1)
+        shared = SharedPriority(BULK)
+        waiting = [
+            asyncio.ensure_future(request(limiter, "page0", BULK)),
+            asyncio.ensure_future(request(limiter, "page1", BULK)),
+            asyncio.ensure_future(request(limiter, "shared", shared)),
+        ]
+        await asyncio.sleep(0.005)
+        shared.raise_to(INTERACTIVE)
+        await asyncio.gather(*waiting)
+        return shared
+
+    shared = asyncio.new_event_loop().run_until_complete(main())
+    assert order == ["page0", "shared", "page1"]
+    assert shared.value == INTERACTIVE and shared.waiting is None
+
+
+def test_limiter_cancelled_waiter():
+    """ A cancelled waiter doesn't keep its slot """
+
+    async def main():
+        limiter = HostLimiter(max_in_flight=1)
+        async with limiter.slot():
+            waiter = asyncio.ensure_future(limiter.acquire(BULK))
+            await asyncio.sleep(0)
+            waiter.cancel()
+        async with limiter.slot():
+            return limiter.in_flight
+
+    assert asyncio.new_event_loop().run_until_complete(main()) == 1
+
+
+def test_limiter_caps_requests_in_flight():
+    """ No more than max_in_flight requests hold a slot at once """
+    in_flight = []
+
+    async def request(limiter):
+        async with limiter.slot():
+            in_flight.append(1)
+            assert len(in_flight) <= 2
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+    async def main():
+        limiter = HostLimiter(max_in_flight=2)
+        await asyncio.gather(*[request(limiter) for _ in range(6)])
+        return limiter
+
+    limiter = asyncio.new_event_loop().run_until_complete(main())
+    assert limiter.requests == 6
+    assert limiter.max_wait_seconds >= 0.015
+    assert limiter.wait_seconds > limiter.max_wait_seconds
+
+
+def test_limiter_rate():
+    """ The token bucket spaces out the requests """
+
+    async def main():
+        limiter = HostLimiter(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(4):
+            async with limiter.slot():
+                pass
+        return time.monotonic() - start
+
+    assert asyncio.new_event_loop().run_until_complete(main()) >= 0.055
+
+
+def test_limiter_registry():
+    """ The limiters are shared per host and rebuilt when the limits change """
+
+    async def main():
+        config = dict(max_in_flight="4")
+        limiter = LIMITERS.limiter("https://tower.example.com/api/v2/jobs/", config)
+        same = LIMITERS.limiter("https://tower.example.com/api/v2/hosts/", config)
+        other = LIMITERS.limiter("https://other.example.com/api/v2/jobs/", config)
+        changed = LIMITERS.limiter(
+            "https://tower.example.com/api/v2/jobs/", dict(max_in_flight="8")
+        )
+        return limiter, same, other, changed
+
+    limiter, same, other, changed = asyncio.new_event_loop().run_until_complete(main())
+    assert limiter is same
+    assert limiter is not other
+    assert changed is not limiter and changed.settings == (8, 0, None)
+
+
+def test_limiter_registry_default():
+    """ Without limits the requests are capped at the connections per host
+        of the pool so they are still scheduled by priority
+    """
+
+    async def main():
+        return (
+            LIMITERS.limiter("https://tower.example.com/", {}),
+            LIMITERS.limiter(
+                "https://other.example.com/", dict(connection_limit_per_host="4")
+            ),
+        )
+
+    default, other = asyncio.new_event_loop().run_until_complete(main())
+    assert default.settings == (10, 0, None) and not default.configured
+    assert other.settings == (4, 0, None) and not other.configured
@@ -0,0 +1,60 @@
+""" Test the lazy and sampled logging of the worker """
+import logging
+from receptor_catalog import logs
+from fake_receptor import list_body, run_filtered_get
+from test_data import TestData
+
+
+def big_body():
+    """ A list response with a big description """
+    template = dict(TestData.JOB_TEMPLATE_1, description="d" * 100000)
+    return list_body(template)
+
+
+def count_previews(monkeypatch):
+    """ Count the previews formatted for log messages """
+    formatted = []
+    original = logs.Preview.__str__
+
+    def counting_str(self):
+        formatted.append(self.value)
+        return original(self)
+
+    monkeypatch.setattr(logs.Preview, "__str__", counting_str)
+    monkeypatch.setattr(logs.Preview, "__repr__", counting_str)
+    return formatted
+
+
+def test_no_body_formatting_at_info(monkeypatch, caplog):
+    """ At INFO the bodies and payloads are never formatted """
+    formatted = count_previews(monkeypatch)
+    caplog.set_level(logging.INFO, logger="receptor")
+    response = run_filtered_get(body=big_body())
+    assert response["status"] == 200
+    assert formatted == []
+    assert not [record for record in caplog.records if record.levelno < logging.INFO]
+
+
+def test_debug_previews_are_truncated(monkeypatch, caplog):
+    """ At DEBUG the bodies are logged as truncated previews """
+    formatted = count_previews(monkeypatch)
+    caplog.set_level(logging.DEBUG, logger="receptor")
+    run_filtered_get(body=big_body())
+    assert formatted
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("Response from filter" in message for message in messages)
+    assert max(len(message) for message in messages) < 4 * logs.DEFAULT_PREVIEW_SIZE
+    record = next(
+        record for record in caplog.records if "Response from filter" in record.msg
+    )
+    assert record.href_slug == "api/v2/job_templates"
+    assert record.method == "get"
+
+
+def test_debug_logging_sampled(caplog):
+    """ With a sample rate of 0 a run logs no debug messages """
+    caplog.set_level(logging.DEBUG, logger="receptor")
+    run_filtered_get(body=big_body(), log_sample_rate=0)
+    assert not [
+        record for record in caplog.records if "Response from filter" in record.msg
+    ]
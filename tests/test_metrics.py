@@ -0,0 +1,172 @@
+""" Test the per phase metrics of the worker """
+import json
+import logging
+import socket
+import pytest
+from receptor_catalog import metrics
+from receptor_catalog import worker
+from fake_receptor import list_body, run_filtered_get
+from test_data import TestData
+
+
+def test_run_metrics_snapshot():
+    """ The phases are summed and only the timed ones are reported """
+    run_metrics = metrics.RunMetrics("get", "api/v2/hosts")
+    run_metrics.add("parse", 0.25)
+    run_metrics.add("parse", 0.5)
+    with run_metrics.time("encode"):
+        pass
+    run_metrics.count("pages")
+    run_metrics.count("bytes_out", 100)
+    run_metrics.finish()
+
+    snapshot = run_metrics.snapshot()
+    assert snapshot["phases"]["parse"] == 0.75
+    assert set(snapshot["phases"]) == {"parse", "encode"}
+    assert snapshot["pages"] == 1
+    assert snapshot["bytes_out"] == 100
+    assert snapshot["retries"] == 0
+    assert snapshot["seconds"] >= 0
+
+
+def test_registry_render():
+    """ The runs are rendered in the Prometheus text format """
+    registry = metrics.MetricsRegistry()
+    run_metrics = metrics.RunMetrics("get", "api/v2/hosts")
+    run_metrics.add("read", 0.5)
+    run_metrics.count("requests", 3)
+    run_metrics.finish()
+    registry.record(run_metrics)
+
+    text = registry.render()
+    assert 'receptor_catalog_run_seconds_count{method="get"} 1' in text
+    assert 'receptor_catalog_run_seconds_bucket{method="get",le="+Inf"} 1' in text
+    assert 'receptor_catalog_phase_seconds_total{method="get",phase="read"} 0.5' in text
+    assert 'receptor_catalog_requests_total{method="get"} 3' in text
+
+
+def test_sinks_from_config():
+    """ The sinks are built from the comma separated metrics_sinks """
+    assert metrics.sinks_from_config({}) == []
+    sinks = metrics.sinks_from_config(
+        dict(metrics_sinks="log, prometheus_file", metrics_file="metrics.prom")
+    )
+    assert [type(sink) for sink in sinks] == [
+        metrics.LogSink,
+        metrics.PrometheusFileSink,
+    ]
+
+
+def test_sinks_from_config_errors():
+    """ Unknown sinks and missing options are reported """
+    with pytest.raises(Exception) as excinfo:
+        metrics.sinks_from_config(dict(metrics_sinks="statsd"))
+    assert "Unknown metrics sink statsd" in str(excinfo.value)
+
+    with pytest.raises(Exception) as excinfo:
+        metrics.sinks_from_config(dict(metrics_sinks="prometheus_http"))
+    assert "metrics_port needs to be set" in str(excinfo.value)
+
+
+def test_sink_emit_default():
+    """ A sink only has to override what it needs """
+    metrics.Sink().emit(metrics.RunMetrics("get", "api/v2/hosts"))
+
+
+def test_register_sink(monkeypatch):
+    """ A registered sink can be listed in metrics_sinks """
+
+    class ListSink(metrics.Sink):
+        def __init__(self, config):
+            self.emitted = []
+
+        def emit(self, run_metrics):
+            self.emitted.append(run_metrics)
+
+    monkeypatch.setitem(metrics.SINKS, "list", ListSink)
+    [sink] = metrics.sinks_from_config(dict(metrics_sinks="list"))
+    sink.emit(metrics.RunMetrics("get", "api/v2/hosts"))
+    assert len(sink.emitted) == 1
+
+
+def test_execute_include_timings():
+    """ The timings of the run so far are added to the response """
+    response = run_filtered_get(TestData.RECEPTOR_CONFIG, include_timings=True)
+
+    timings = response["timings"]
+    assert timings["requests"] == 1
+    assert timings["pages"] == 1
+    assert timings["retries"] == 0
+    for phase in ("read", "parse", "filter", "encode"):
+        assert phase in timings["phases"]
+
+
+def test_execute_without_timings():
+    """ The timings are left out by default """
+    response = run_filtered_get(TestData.RECEPTOR_CONFIG)
+    assert "timings" not in response
+
+
+def test_execute_metrics_sinks(tmp_path, caplog):
+    """ The metrics of a finished run are logged and written to a file """
+    caplog.set_level(logging.INFO, logger=metrics.__name__)
+    metrics_file = tmp_path / "receptor_catalog.prom"
+    config = dict(
+        TestData.RECEPTOR_CONFIG,
+        metrics_sinks="log,prometheus_file",
+        metrics_file=str(metrics_file),
+    )
+    run_filtered_get(config)
+
+    [record] = [record for record in caplog.records if record.name == metrics.__name__]
+    logged = json.loads(record.getMessage().split(" ", 2)[2])
+    assert logged["method"] == "get"
+    assert logged["href_slug"] == "api/v2/job_templates"
+    assert logged["pages"] == 1
+    assert "receptor_catalog_run_seconds_count" in metrics_file.read_text()
+
+
+def test_execute_metrics_recorded_once(tmp_path, monkeypatch):
+    """ A run is recorded once whatever the number of Prometheus sinks """
+    registry = metrics.MetricsRegistry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    monkeypatch.setattr(worker, "REGISTRY", registry)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    metrics_file = tmp_path / "receptor_catalog.prom"
+    config = dict(
+        TestData.RECEPTOR_CONFIG,
+        metrics_sinks="prometheus_file,prometheus_http",
+        metrics_file=str(metrics_file),
+        metrics_port=str(port),
+    )
+    run_filtered_get(config)
+
+    text = metrics_file.read_text()
+    assert 'receptor_catalog_run_seconds_count{method="get"} 1' in text
+
+
+def test_execute_streamed_bytes_in():
+    """ The bytes of a streamed page are counted as they are read """
+    response = run_filtered_get(
+        TestData.RECEPTOR_CONFIG, stream_results=True, include_timings=True
+    )
+    body = list_body(TestData.JOB_TEMPLATE_1)
+    assert response["timings"]["bytes_in"] == len(body)
+
+
+def test_execute_metrics_port_in_use(caplog):
+    """ A sink that can't be prepared doesn't fail the requests """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        config = dict(
+            TestData.RECEPTOR_CONFIG,
+            metrics_sinks="prometheus_http",
+            metrics_port=str(sock.getsockname()[1]),
+        )
+        for _ in range(2):
+            response = run_filtered_get(config)
+            assert response["status"] == 200
+    assert "failed to prepare" in caplog.text
@@ -0,0 +1,69 @@
+""" Test the job monitoring schedule """
+from datetime import datetime, timedelta
+import asyncio
+import json
+import time
+from receptor_catalog.monitor import JobMonitor, PollSchedule
+
+
+def test_schedule_backs_off_to_the_cap():
+    """ The delay grows geometrically until it reaches the cap """
+    schedule = PollSchedule(initial=1, factor=2, maximum=10, jitter=0)
+    assert [schedule.delay(polls) for polls in range(1, 7)] == [1, 2, 4, 8, 10, 10]
+    assert schedule.delay(10000) == 10
+
+
+def test_schedule_jitter():
+    """ The jitter spreads the delays around the schedule """
+    schedule = PollSchedule(initial=4, factor=1, maximum=4, jitter=0.25)
+    delays = {schedule.delay(1) for _ in range(100)}
+    assert len(delays) > 1
+    assert all(3 <= delay <= 5 for delay in delays)
+
+
+def test_schedule_uses_elapsed():
+    """ A job that has been running for long is polled less often """
+    schedule = PollSchedule(
+        initial=1, factor=2, maximum=300, jitter=0, use_elapsed=True
+    )
+    assert schedule.delay(1, dict(elapsed=400.0)) == 100
+    assert schedule.delay(1, dict(elapsed=2000.0)) == 300
+
+    started = (datetime.utcnow() - timedelta(seconds=800)).strftime(
+        PollSchedule.TIMESTAMP_FORMAT
+    )
+    assert 199 <= schedule.delay(1, dict(elapsed=0.0, started=started)) <= 201
+    assert schedule.delay(1, dict(elapsed=0.0, started=None)) == 1
+
+    schedule.use_elapsed = False
+    assert schedule.delay(1, dict(elapsed=400.0)) == 1
+
+
+def test_job_monitor_wakes_up_for_a_new_job():
+    """ A job added while the poller sleeps a backed off interval is polled
+        right away
+    """
+    statuses = {1: "running", 2: "successful"}
+
+    async def fetch(_url, params):
+        ids = [int(job_id) for job_id in params["id__in"].split(",")]
+        results = [dict(id=job_id, status=statuses[job_id]) for job_id in ids]
+        return dict(status=200, body=json.dumps(dict(results=results)))
+
+    async def main():
+        job_monitor = JobMonitor(None, "/api/v2/jobs/")
+        slow = PollSchedule(initial=10, jitter=0)
+        first = asyncio.ensure_future(job_monitor.wait(1, slow, fetch))
+        await asyncio.sleep(0.05)
+        start = time.monotonic()
+        fast = PollSchedule(initial=0.2, jitter=0)
+        job, _ = await job_monitor.wait(2, fast, fetch)
+        elapsed = time.monotonic() - start
+        first.cancel()
+        job_monitor.task.cancel()
+        await asyncio.gather(first, job_monitor.task, return_exceptions=True)
+        return job, elapsed
+
+    job, elapsed = asyncio.new_event_loop().run_until_complete(main())
+    assert job["status"] == "successful"
+    assert elapsed < 1
@@ -0,0 +1,91 @@
+""" Test the retry budget and the circuit breaker """
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import time
+import pytest
+from receptor_catalog.retry import (
+    BREAKERS,
+    CircuitBreaker,
+    RetryBudget,
+    retry_after_seconds,
+)
+
+
+def test_retry_after_seconds():
+    """ Retry-After is given in seconds or as a HTTP date """
+    assert retry_after_seconds("3") == 3
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("soon") is None
+    later = datetime.now(timezone.utc) + timedelta(seconds=120)
+    assert 110 < retry_after_seconds(format_datetime(later, usegmt=True)) <= 120
+    earlier = datetime.now(timezone.utc) - timedelta(seconds=120)
+    assert retry_after_seconds(format_datetime(earlier, usegmt=True)) == 0
+
+
+def test_retry_budget():
+    """ Retries spend tokens that successful requests earn back """
+    budget = RetryBudget(size=2, ratio=0.5)
+    assert budget.spend() and budget.spend()
+    assert not budget.spend()
+    budget.earn()
+    assert not budget.spend()
+    budget.earn()
+    assert budget.spend()
+
+
+def test_circuit_breaker_opens_and_recovers():
+    """ The circuit opens after the threshold and lets a trial through
+        after the reset period
+    """
+    breaker = CircuitBreaker("tower", 2, 0.05, RetryBudget(1, 0.1))
+    breaker.failure()
+    breaker.check()
+    breaker.failure()
+    with pytest.raises(Exception, match="Circuit open for tower"):
+        breaker.check()
+
+    time.sleep(0.05)
+    breaker.check()
+    with pytest.raises(Exception, match="Circuit open"):
+        breaker.check()
+    breaker.failure()
+    with pytest.raises(Exception, match="Circuit open"):
+        breaker.check()
+
+    time.sleep(0.05)
+    breaker.check()
+    breaker.success()
+    breaker.check()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_breaker_trial_without_outcome():
+    """ A trial that ends without a success opens the circuit again """
+    breaker = CircuitBreaker("tower", 1, 0.05, RetryBudget(1, 0.1))
+    breaker.failure()
+    time.sleep(0.05)
+    assert breaker.check()
+    breaker.finish_trial()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(Exception, match="Circuit open"):
+        breaker.check()
+
+    time.sleep(0.05)
+    assert breaker.check()
+    breaker.success()
+    breaker.finish_trial()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert not breaker.check()
+
+
+def test_breakers_per_host():
+    """ The hosts have their own breaker, rebuilt when the config changes """
+    BREAKERS.clear()
+    breaker = BREAKERS.breaker("https://tower.example.com/api/v2/jobs/", {})
+    assert BREAKERS.breaker("https://tower.example.com/api/v2/hosts/", {}) is breaker
+    assert BREAKERS.breaker("https://other.example.com/api/v2/jobs/", {}) is not breaker
+    changed = BREAKERS.breaker(
+        "https://tower.example.com/", dict(circuit_failure_threshold="1")
+    )
+    assert changed is not breaker and changed.threshold == 1
+    BREAKERS.clear()
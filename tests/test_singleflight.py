@@ -0,0 +1,81 @@
+""" Tests for the single flight of identical requests """
+import asyncio
+from receptor_catalog.limiter import BULK, INTERACTIVE, SharedPriority
+from receptor_catalog.singleflight import SingleFlight
+
+
+def test_single_flight_shares_the_response():
+    """ Concurrent callers with the same key share one fetch """
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return dict(status=200)
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*[flight.do("key", fetch) for _ in range(5)])
+        assert flight.shared == 4
+        assert not flight.flights
+        await flight.do("key", fetch)
+        return results
+
+    results = asyncio.new_event_loop().run_until_complete(main())
+    assert results == [dict(status=200)] * 5
+    assert len(calls) == 2
+
+
+def test_single_flight_survives_cancelled_caller():
+    """ The fetch keeps going for the others when its starter is cancelled """
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "body"
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.new_event_loop().run_until_complete(main()) == "body"
+
+
+def test_single_flight_shares_errors():
+    """ Every caller gets the error of the fetch """
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise Exception("Tower is down")
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(
+            *[flight.do("key", fetch) for _ in range(2)], return_exceptions=True
+        )
+
+    errors = asyncio.new_event_loop().run_until_complete(main())
+    assert [str(err) for err in errors] == ["Tower is down"] * 2
+
+
+def test_single_flight_raises_priority():
+    """ A caller joining the request in flight raises its priority """
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "body"
+
+    async def main():
+        flight = SingleFlight()
+        shared = SharedPriority(BULK)
+        first = asyncio.ensure_future(flight.do("key", fetch, shared))
+        await asyncio.sleep(0)
+        await flight.do("key", fetch, SharedPriority(INTERACTIVE))
+        await first
+        return shared
+
+    assert asyncio.new_event_loop().run_until_complete(main()).value == INTERACTIVE
@@ -0,0 +1,70 @@
+""" Test the streaming parser of list responses """
+import json
+import jmespath
+import pytest
+from receptor_catalog.stream import ResultsParser, item_expression
+
+
+def parse_in_pieces(text, project, size):
+    """ Feed the text to a parser in pieces of size characters """
+    parser = ResultsParser(project)
+    for index in range(0, len(text), size):
+        parser.feed(text[index : index + size])
+    return parser.close()
+
+
+def test_results_are_projected_item_by_item():
+    """ Only the projected values of the items are kept """
+    document = dict(
+        count=30,
+        next="/api/v2/hosts/?page=2",
+        previous=None,
+        results=[
+            dict(id=index, name=f"host{index}", facts=dict(blob="x" * 500), cpu=1.5e3)
+            for index in range(30)
+        ],
+        extra=-12,
+    )
+    text = json.dumps(document, indent=1)
+    seen = []
+
+    def project(item):
+        seen.append(item["id"])
+        return dict(id=item["id"], cpu=item["cpu"])
+
+    for size in (1, 7, 64, len(text)):
+        seen.clear()
+        parsed = parse_in_pieces(text, project, size)
+        assert seen == list(range(30))
+        assert parsed == dict(
+            document,
+            results=[dict(id=item["id"], cpu=1.5e3) for item in document["results"]],
+        )
+
+
+def test_numbers_split_across_pieces():
+    """ A number cut at the end of a piece isn't taken as complete """
+    parsed = parse_in_pieces('{"count": 12345, "results": [1.5e10, 2]}', int, 3)
+    assert parsed == dict(count=12345, results=[15000000000, 2])
+
+
+def test_incomplete_or_invalid_documents():
+    """ Truncated and invalid documents raise like json.loads """
+    with pytest.raises(json.JSONDecodeError):
+        parse_in_pieces('{"count": 1, "results": [{"id": 1}', dict, 5)
+    with pytest.raises(json.JSONDecodeError):
+        parse_in_pieces('{"count": 1; "results": []}', dict, 5)
+    assert parse_in_pieces("{}", dict, 1) == {}
+
+
+def test_item_expression():
+    """ Only plain projections of the results can be applied per item """
+    item = item_expression(jmespath.compile("results[].{id: id, name: name}"))
+    assert item.search(dict(id=1, name="one", facts={})) == dict(id=1, name="one")
+    assert (
+        item_expression(jmespath.compile("results[*].name")).search(dict(name="one"))
+        == "one"
+    )
+    assert item_expression(jmespath.compile("results[].name | [0]")) is None
+    assert item_expression(jmespath.compile("hosts[].name")) is None
+    assert item_expression(jmespath.compile("results[0]")) is None
@@ -4,9 +4,18 @@ import logging
 import queue
 import gzip
 import ast
-from aioresponses import aioresponses
+import asyncio
+import os
+import re
+import threading
+import time
+from aiohttp import web
+from aioresponses import aioresponses, CallbackResult
 import pytest
 from receptor_catalog import worker
+from receptor_catalog import runtime
+from receptor_catalog import zdict
+from fake_receptor import FakeMessage
 from test_data import TestData
 
 
@@ -15,14 +24,6 @@ receptor_logger = logging.getLogger("receptor")
 receptor_logger.addHandler(logging.StreamHandler())
 
 
-class FakeMessage:
-    """ Class to create a Fake Message, that is sent from the receptor
-        to the plugin
-    """
-
-    raw_payload = None
-
-
 def run_get(config, payload, response):
     """ Run a HTTP GET Command """
     message = FakeMessage()
@@ -122,6 +123,73 @@ def test_execute_get_success_with_filter_gzip():
     )
 
 
+def test_execute_get_success_with_gzip_raw_body():
+    """ Test GZIP of Response Data with the body embedded as JSON """
+    response_queue = run_get(
+        TestData.RECEPTOR_CONFIG,
+        json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_GZIPPED_RAW),
+        TestData.JOB_TEMPLATE_RESPONSE,
+    )
+    response = json.loads(gzip.decompress(response_queue.get()))
+    assert response["body_encoding"] == "json"
+    assert response["body"] == TestData.JOB_TEMPLATE_RESPONSE
+    assert response["status"] == 200
+
+
+def test_execute_get_success_with_zdict():
+    """ Test compression of Response Data with the preset dictionary """
+    response_queue = run_get(
+        dict(TestData.RECEPTOR_CONFIG, zdict_experimental="True"),
+        json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_ZDICT),
+        TestData.JOB_TEMPLATE_RESPONSE,
+    )
+    response = json.loads(zdict.decompress(response_queue.get()))
+    assert response["body_encoding"] == "json"
+    assert response["body"] == TestData.JOB_TEMPLATE_RESPONSE
+    assert response["status"] == 200
+
+
+def test_execute_get_zdict_needs_opt_in():
+    """ zdict is only used when it is enabled in the config """
+    message = FakeMessage()
+    message.raw_payload = json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_ZDICT)
+    with pytest.raises(Exception) as excinfo:
+        worker.execute(message, TestData.RECEPTOR_CONFIG, queue.Queue())
+    assert "zdict is experimental" in str(excinfo.value)
+
+
+def test_execute_get_gzip_level_and_min_size():
+    """ The compression level and minimum size come from the config """
+    config = dict(TestData.RECEPTOR_CONFIG, gzip_level="9")
+    result = run_get(
+        config,
+        json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_GZIPPED),
+        TestData.JOB_TEMPLATE_RESPONSE,
+    ).get()
+    # The XFL byte of the gzip header is 2 when the maximum level was used
+    assert result[8] == 2
+
+    result = run_get(
+        TestData.RECEPTOR_CONFIG,
+        json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_GZIPPED),
+        TestData.JOB_TEMPLATE_RESPONSE,
+    ).get()
+    assert result[8] == 0
+
+    config = dict(TestData.RECEPTOR_CONFIG, gzip_min_size="4096")
+    response = run_get(
+        config,
+        json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_GZIPPED),
+        TestData.JOB_TEMPLATE_RESPONSE,
+    ).get()
+    validate_get_response(
+        response,
+        200,
+        TestData.JOB_TEMPLATE_COUNT,
+        [TestData.JOB_TEMPLATE_1, TestData.JOB_TEMPLATE_2],
+    )
+
+
 def test_execute_get_success_with_multiple_pages():
     """ Test Multiple pages of response coming back """
     response_queue = queue.Queue()
@@ -158,6 +226,512 @@ def test_execute_get_success_with_multiple_pages():
     )
 
 
+def test_execute_get_all_pages_concurrently():
+    """ Pages after the first one are fetched concurrently but sent in order """
+    response_queue = queue.Queue()
+    message = FakeMessage()
+    message.raw_payload = json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES_CONCURRENT)
+    headers = {"Content-Type": "application/json"}
+    page1, page2, page3 = TestData.JOB_TEMPLATES_PAGES_OF_ONE_RESPONSES
+    in_flight = dict(current=0, peak=0)
+
+    def delayed(delay):
+        async def callback(_url, **_kwargs):
+            in_flight["current"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+            await asyncio.sleep(delay)
+            in_flight["current"] -= 1
+
+        return callback
+
+    with aioresponses() as mocked:
+        mocked.get(
+            TestData.JOB_TEMPLATES_LIST_URL,
+            status=200,
+            body=json.dumps(page1),
+            headers=headers,
+        )
+        mocked.get(
+            TestData.JOB_TEMPLATES_LIST_URL_PAGE_2,
+            status=200,
+            body=json.dumps(page2),
+            headers=headers,
+            callback=delayed(0.1),
+        )
+        mocked.get(
+            TestData.JOB_TEMPLATES_LIST_URL_PAGE_3,
+            status=200,
+            body=json.dumps(page3),
+            headers=headers,
+            callback=delayed(0),
+        )
+        worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+
+    assert in_flight["peak"] == 2
+    for job_template in (
+        TestData.JOB_TEMPLATE_1,
+        TestData.JOB_TEMPLATE_2,
+        TestData.JOB_TEMPLATE_3,
+    ):
+        validate_get_response(
+            response_queue.get(), 200, TestData.JOB_TEMPLATE_COUNT, [job_template]
+        )
+    assert response_queue.empty()
+
+
+def test_execute_get_retries_the_failed_page():
+    """ A transient failure of a page is retried after Retry-After and the
+        crawl resumes from that page instead of starting over
+    """
+    worker.BREAKERS.clear()
+    response_queue = queue.Queue()
+    message = FakeMessage()
+    message.raw_payload = json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES_CONCURRENT)
+    config = dict(TestData.RECEPTOR_CONFIG, retry_initial_seconds="0.01")
+    page1, page2, page3 = TestData.JOB_TEMPLATES_PAGES_OF_ONE_RESPONSES
+    with aioresponses() as mocked:
+        mocked.get(TestData.JOB_TEMPLATES_LIST_URL, status=200, body=json.dumps(page1))
+        mocked.get(
+            TestData.JOB_TEMPLATES_LIST_URL_PAGE_2,
+            status=503,
+            body="Service Unavailable",
+            headers={"Retry-After": "0.05"},
+        )
+        mocked.get(
+            TestData.JOB_TEMPLATES_LIST_URL_PAGE_2, status=200, body=json.dumps(page2)
+        )
+        mocked.get(
+            TestData.JOB_TEMPLATES_LIST_URL_PAGE_3, status=200, body=json.dumps(page3)
+        )
+        start = time.monotonic()
+        worker.execute(message, config, response_queue)
+        assert time.monotonic() - start >= 0.05
+        requests = {str(url): len(calls) for (_, url), calls in mocked.requests.items()}
+
+    assert requests == {
+        TestData.JOB_TEMPLATES_LIST_URL: 1,
+        TestData.JOB_TEMPLATES_LIST_URL_PAGE_2: 2,
+        TestData.JOB_TEMPLATES_LIST_URL_PAGE_3: 1,
+    }
+    for job_template in (
+        TestData.JOB_TEMPLATE_1,
+        TestData.JOB_TEMPLATE_2,
+        TestData.JOB_TEMPLATE_3,
+    ):
+        validate_get_response(
+            response_queue.get(), 200, TestData.JOB_TEMPLATE_COUNT, [job_template]
+        )
+    assert response_queue.empty()
+
+
+def test_execute_get_gives_up_on_long_retry_after():
+    """ A Retry-After past retry_max_seconds is not waited for """
+    worker.BREAKERS.clear()
+    message = FakeMessage()
+    message.raw_payload = json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES)
+    config = dict(TestData.RECEPTOR_CONFIG, retry_max_seconds="5")
+    with aioresponses() as mocked:
+        mocked.get(
+            TestData.JOB_TEMPLATES_LIST_URL,
+            status=429,
+            body="Too Many Requests",
+            headers={"Retry-After": "60"},
+        )
+        with pytest.raises(Exception) as excinfo:
+            worker.execute(message, config, queue.Queue())
+    assert "status 429" in str(excinfo.value)
+
+
+def test_execute_circuit_breaker_fails_fast():
+    """ Once Tower failed too many times in a row requests fail right away """
+    worker.BREAKERS.clear()
+    config = dict(
+        TestData.RECEPTOR_CONFIG, circuit_failure_threshold="2", retry_budget="0"
+    )
+    try:
+        with aioresponses() as mocked:
+            mocked.get(TestData.JOB_TEMPLATES_LIST_URL, status=502, repeat=True)
+            for _ in range(2):
+                message = FakeMessage()
+                message.raw_payload = json.dumps(
+                    TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES
+                )
+                with pytest.raises(Exception, match="status 502"):
+                    worker.execute(message, config, queue.Queue())
+
+            message = FakeMessage()
+            message.raw_payload = json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES)
+            with pytest.raises(Exception, match="Circuit open"):
+                worker.execute(message, config, queue.Queue())
+            assert sum(len(calls) for calls in mocked.requests.values()) == 2
+    finally:
+        worker.BREAKERS.clear()
+
+
+def test_execute_circuit_breaker_trial_throttled():
+    """ A trial request answered with a 429 opens the circuit again instead
+        of leaving it half open for good
+    """
+    worker.BREAKERS.clear()
+    config = dict(
+        TestData.RECEPTOR_CONFIG,
+        circuit_failure_threshold="1",
+        circuit_reset_seconds="0.05",
+        retry_initial_seconds="0.01",
+    )
+
+    def get():
+        message = FakeMessage()
+        message.raw_payload = json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE)
+        response_queue = queue.Queue()
+        worker.execute(message, config, response_queue)
+        return response_queue.get()
+
+    try:
+        with aioresponses() as mocked:
+            mocked.get(TestData.JOB_TEMPLATES_LIST_URL, status=500)
+            mocked.get(
+                TestData.JOB_TEMPLATES_LIST_URL,
+                status=429,
+                headers={"Retry-After": "0"},
+            )
+            mocked.get(
+                TestData.JOB_TEMPLATES_LIST_URL,
+                status=200,
+                body=json.dumps(TestData.JOB_TEMPLATE_RESPONSE),
+            )
+            with pytest.raises(Exception, match="status 500"):
+                get()
+            time.sleep(0.06)
+            with pytest.raises(Exception, match="Circuit open"):
+                get()
+            time.sleep(0.06)
+            assert get()["status"] == 200
+        [breaker] = [breaker for breaker, _ in worker.BREAKERS.breakers.values()]
+        assert breaker.state == breaker.CLOSED
+    finally:
+        worker.BREAKERS.clear()
+
+
+class SlowQueue(queue.Queue):
+    """ A response queue that records when each page was sent """
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def put(self, item, block=True, timeout=None):
+        time.sleep(0.1)
+        self.events.append("sent")
+        super().put(item, block, timeout)
+
+
+def test_execute_get_all_pages_pipelined():
+    """ The next page is fetched while the current page is being sent """
+    events = []
+    response_queue = SlowQueue(events)
+    message = FakeMessage()
+    message.raw_payload = json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES_PIPELINED)
+    headers = {"Content-Type": "application/json"}
+
+    def fetched(page):
+        def callback(_url, **_kwargs):
+            events.append(f"fetched {page}")
+
+        return callback
+
+    with aioresponses() as mocked:
+        for page, url in enumerate(
+            (
+                TestData.JOB_TEMPLATES_LIST_URL,
+                TestData.JOB_TEMPLATES_LIST_URL_PAGE_2,
+                TestData.JOB_TEMPLATES_LIST_URL_PAGE_3,
+            )
+        ):
+            mocked.get(
+                url,
+                status=200,
+                body=json.dumps(TestData.JOB_TEMPLATES_PAGES_OF_ONE_RESPONSES[page]),
+                headers=headers,
+                callback=fetched(page + 1),
+            )
+        worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+
+    assert events.index("fetched 2") < events.index("sent")
+    assert events.index("fetched 3") < len(events) - 1
+    for job_template in (
+        TestData.JOB_TEMPLATE_1,
+        TestData.JOB_TEMPLATE_2,
+        TestData.JOB_TEMPLATE_3,
+    ):
+        validate_get_response(
+            response_queue.get(), 200, TestData.JOB_TEMPLATE_COUNT, [job_template]
+        )
+
+
+def run_get_pages_of_one(payload, config=TestData.RECEPTOR_CONFIG):
+    """ Run a HTTP GET Command over a collection with 3 pages of 1 item """
+    message = FakeMessage()
+    message.raw_payload = json.dumps(payload)
+    response_queue = queue.Queue()
+    headers = {"Content-Type": "application/json"}
+    with aioresponses() as mocked:
+        for page, url in enumerate(
+            (
+                TestData.JOB_TEMPLATES_LIST_URL,
+                TestData.JOB_TEMPLATES_LIST_URL_PAGE_2,
+                TestData.JOB_TEMPLATES_LIST_URL_PAGE_3,
+            )
+        ):
+            mocked.get(
+                url,
+                status=200,
+                body=json.dumps(TestData.JOB_TEMPLATES_PAGES_OF_ONE_RESPONSES[page]),
+                headers=headers,
+            )
+        worker.execute(message, config, response_queue)
+    return response_queue
+
+
+def test_execute_get_all_pages_coalesced():
+    """ Results of consecutive pages are sent in one message within budget """
+    response_queue = run_get_pages_of_one(
+        TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES_COALESCED
+    )
+
+    response = response_queue.get()
+    assert response["sequence"] == 0
+    assert not response["last_chunk"]
+    validate_get_response(
+        response,
+        200,
+        TestData.JOB_TEMPLATE_COUNT,
+        [TestData.JOB_TEMPLATE_1, TestData.JOB_TEMPLATE_2],
+        ["id", "name"],
+    )
+    assert len(json.loads(response["body"])["results"]) == 2
+
+    response = response_queue.get()
+    assert response["sequence"] == 1
+    assert response["last_chunk"]
+    validate_get_response(
+        response,
+        200,
+        TestData.JOB_TEMPLATE_COUNT,
+        [TestData.JOB_TEMPLATE_3],
+        ["id", "name"],
+    )
+    assert response_queue.empty()
+
+
+def test_execute_get_all_pages_coalesced_byte_budget():
+    """ The byte budget splits the messages, markers survive compression """
+    payload = dict(
+        TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES_COALESCED,
+        coalesce_max_items=100,
+        coalesce_max_bytes=80,
+        accept_encoding="gzip_raw",
+    )
+    response_queue = run_get_pages_of_one(payload)
+    chunks = []
+    while not response_queue.empty():
+        chunks.append(json.loads(gzip.decompress(response_queue.get())))
+    assert [chunk["sequence"] for chunk in chunks] == [0, 1]
+    assert [chunk["last_chunk"] for chunk in chunks] == [False, True]
+    assert [len(chunk["body"]["results"]) for chunk in chunks] == [2, 1]
+
+
+def test_execute_get_passthrough_raw_body():
+    """ Without filters or artifacts the body from Tower is sent untouched """
+    raw_body = '{"count": 1,"next":null, "results": [{"id": 909, "name": "Fr\u00e9d"}]}'
+    message = FakeMessage()
+    message.raw_payload = json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_ALL_PAGES)
+    response_queue = queue.Queue()
+    with aioresponses() as mocked:
+        mocked.get(TestData.JOB_TEMPLATES_LIST_URL, status=200, body=raw_body)
+        worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+
+    response = response_queue.get()
+    assert response["body"] == raw_body
+    assert response_queue.empty()
+
+
+def test_execute_get_single_page_not_parsed(monkeypatch):
+    """ A single page of a bigger collection is passed through without
+        parsing it to size the remaining pages
+    """
+    decoded = []
+    original = worker.Run.decode
+
+    def counting_decode(self, body):
+        decoded.append(body)
+        return original(self, body)
+
+    monkeypatch.setattr(worker.Run, "decode", counting_decode)
+    worker.RESPONSE_CACHE.clear()
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(href_slug="api/v2/job_templates", method="get", params=dict(page_size=1))
+    )
+    response_queue = queue.Queue()
+    with aioresponses() as mocked:
+        mocked.get(
+            TestData.JOB_TEMPLATES_LIST_URL,
+            status=200,
+            body=json.dumps(TestData.JOB_TEMPLATES_PAGE1_RESPONSE),
+        )
+        worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+
+    response = response_queue.get()
+    assert response["status"] == 200
+    assert json.loads(response["body"])["next"]
+    assert decoded == []
+
+
+def run_get_twice(payload, responses):
+    """ Run the same HTTP GET Command twice, returns the results and the
+        headers Tower received with each request
+    """
+    received = []
+    responses = list(responses)
+
+    def callback(url, **kwargs):
+        received.append(kwargs.get("headers") or {})
+        return responses.pop(0)
+
+    results = []
+    with aioresponses() as mocked:
+        mocked.get(TestData.JOB_TEMPLATES_LIST_URL, callback=callback, repeat=True)
+        for _ in range(2):
+            message = FakeMessage()
+            message.raw_payload = json.dumps(payload)
+            response_queue = queue.Queue()
+            worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+            results.append(response_queue.get())
+    return results, received
+
+
+def test_execute_get_revalidates_cached_response():
+    """ A cached page is revalidated with its ETag and reused on a 304 """
+    worker.RESPONSE_CACHE.clear()
+    payload = dict(
+        href_slug="api/v2/job_templates",
+        method="get",
+        fetch_all_pages="False",
+        apply_filter=dict(results="results[].{id: id, name:name}"),
+        params=dict(page_size=1),
+    )
+    (first, second), received = run_get_twice(
+        payload,
+        [
+            CallbackResult(
+                status=200,
+                body=json.dumps(TestData.JOB_TEMPLATE_RESPONSE),
+                headers={"ETag": '"v1"'},
+            ),
+            CallbackResult(status=304, body=""),
+        ],
+    )
+
+    assert "If-None-Match" not in received[0]
+    assert received[1]["If-None-Match"] == '"v1"'
+    assert second == first
+    validate_get_response(
+        second,
+        200,
+        TestData.JOB_TEMPLATE_COUNT,
+        [TestData.JOB_TEMPLATE_1, TestData.JOB_TEMPLATE_2],
+        ["id", "name"],
+    )
+
+
+def test_execute_get_cached_response_within_ttl():
+    """ Within the TTL a cached page is served without asking Tower """
+    worker.RESPONSE_CACHE.clear()
+    payload = dict(
+        href_slug="api/v2/job_templates",
+        method="get",
+        fetch_all_pages="False",
+        cache_ttl_seconds=60,
+        params=dict(page_size=1),
+    )
+    body = json.dumps(TestData.JOB_TEMPLATE_RESPONSE)
+    (first, second), received = run_get_twice(
+        payload, [CallbackResult(status=200, body=body)]
+    )
+
+    assert len(received) == 1
+    assert first["body"] == second["body"] == body
+
+
+def test_execute_get_cache_disabled():
+    """ Without validators or a TTL nothing is cached """
+    worker.RESPONSE_CACHE.clear()
+    body = json.dumps(TestData.JOB_TEMPLATE_RESPONSE)
+    payload = dict(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_GZIPPED)
+    payload.pop("accept_encoding")
+    _, received = run_get_twice(
+        payload,
+        [CallbackResult(status=200, body=body), CallbackResult(status=200, body=body)],
+    )
+
+    assert len(received) == 2
+    assert not worker.RESPONSE_CACHE.entries
+
+
+def test_execute_get_streamed_results():
+    """ Streamed results are projected per item like the filter does """
+    hosts = [
+        dict(id=index, name=f"host{index}", ansible_facts=dict(blob="x" * 100))
+        for index in range(20)
+    ]
+    hosts[3]["name"] = None
+    body = json.dumps(dict(count=20, next=None, previous=None, results=hosts))
+    responses = []
+    for stream_results in (False, True):
+        message = FakeMessage()
+        message.raw_payload = json.dumps(
+            dict(
+                href_slug="api/v2/job_templates",
+                method="get",
+                params=dict(page_size=1),
+                stream_results=stream_results,
+                apply_filter=dict(results="results[].name", count="count"),
+            )
+        )
+        response_queue = queue.Queue()
+        with aioresponses() as mocked:
+            mocked.get(TestData.JOB_TEMPLATES_LIST_URL, status=200, body=body)
+            worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+        responses.append(json.loads(response_queue.get()["body"]))
+
+    assert responses[0] == responses[1]
+    assert len(responses[1]["results"]) == 19
+    assert "ansible_facts" not in json.dumps(responses[1])
+
+
+def test_page_info_without_parsing():
+    """ The paging info is extracted from the keys ahead of the results """
+    run = worker.Run(
+        queue.Queue(), dict(href_slug="api/v2/hosts"), TestData.RECEPTOR_CONFIG, logger
+    )
+    body = json.dumps(
+        dict(
+            count=400,
+            next='/api/v2/hosts/?name="a\\b"&page=2',
+            previous=None,
+            results=[dict(id=1, next="/not/this/one", count=5)],
+        )
+    )
+    assert run.page_info(body) == dict(
+        count=400, next='/api/v2/hosts/?name="a\\b"&page=2'
+    )
+    assert run.page_info(json.dumps(dict(count=1, next=None, results=[]))) == dict(
+        count=1, next=None
+    )
+    assert run.page_info(json.dumps(TestData.JOB_1)) == {}
+
+
 def test_execute_get_exception():
     """ When we get a bad data from the server, raise an exception """
     message = FakeMessage()
@@ -221,6 +795,87 @@ def test_execute_get_with_bad_payload():
         worker.execute(message, TestData.RECEPTOR_CONFIG, queue.Queue())
 
 
+def test_execute_with_bad_priority():
+    """ Only the known request classes are accepted """
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(href_slug="api/v2/job_templates", method="get", priority="urgent")
+    )
+    with pytest.raises(Exception) as excinfo:
+        worker.execute(message, TestData.RECEPTOR_CONFIG, queue.Queue())
+    assert "Unknown priority urgent" in str(excinfo.value)
+
+
+def test_execute_with_bad_page_queue_depth():
+    """ A page queue without room for a page would be unbounded """
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(href_slug="api/v2/job_templates", method="get", page_queue_depth=0)
+    )
+    with pytest.raises(Exception) as excinfo:
+        worker.execute(message, TestData.RECEPTOR_CONFIG, queue.Queue())
+    assert "page_queue_depth has to be at least 1" in str(excinfo.value)
+
+
+def test_execute_batch_payload():
+    """ The requests of a batch run concurrently, each response is tagged
+        and sent as soon as it completes, a failure only fails its request
+    """
+    base = "https://www.example.com/api/v2"
+
+    async def slow(_url, **_kwargs):
+        await asyncio.sleep(0.2)
+
+    payload = [
+        dict(id="template", href_slug="api/v2/job_templates/7/", method="get"),
+        dict(
+            id="survey",
+            href_slug="api/v2/job_templates/7/survey_spec/",
+            method="get",
+            apply_filter="{variables: spec[].variable}",
+        ),
+        dict(href_slug="api/v2/inventories/3/", method="get"),
+        "inventory",
+        dict(
+            href_slug="api/v2/hosts/",
+            method="get",
+            apply_filter="results[",
+            accept_encoding="gzip",
+        ),
+    ]
+    message = FakeMessage()
+    message.raw_payload = json.dumps(payload)
+    response_queue = queue.Queue()
+    with aioresponses() as mocked:
+        mocked.get(
+            f"{base}/job_templates/7/",
+            status=200,
+            body=json.dumps(TestData.JOB_TEMPLATE_1),
+            callback=slow,
+        )
+        mocked.get(
+            f"{base}/job_templates/7/survey_spec/",
+            status=200,
+            body=json.dumps(dict(spec=[dict(variable="cost"), dict(variable="env")])),
+        )
+        mocked.get(f"{base}/inventories/3/", status=404, body="Not found")
+        start = time.monotonic()
+        worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+        assert time.monotonic() - start < 0.4
+
+    responses = [response_queue.get() for _ in range(5)]
+    assert response_queue.empty()
+    assert responses[-1]["id"] == "template"
+    by_index = {response["index"]: response for response in responses}
+    assert json.loads(by_index[0]["body"]) == TestData.JOB_TEMPLATE_1
+    assert by_index[1]["id"] == "survey"
+    assert json.loads(by_index[1]["body"]) == dict(variables=["cost", "env"])
+    assert by_index[2]["failed"] and by_index[2]["status"] == 500
+    assert "status 404" in json.loads(by_index[2]["body"])["detail"]
+    assert "is not a request" in by_index[3]["body"]
+    assert by_index[4]["failed"] and "results[" in by_index[4]["body"]
+
+
 def run_post(payload, response):
     """ Helper method to send a HTTP POST """
     message = FakeMessage()
@@ -312,6 +967,33 @@ def test_execute_post_exception_invalid_filter():
             worker.execute(message, TestData.RECEPTOR_CONFIG, queue.Queue())
 
 
+def test_execute_invalid_filter_rejected_before_request():
+    """ An invalid JMESPath filter fails when the payload is parsed """
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        TestData.JOB_TEMPLATE_POST_BAD_FILTERED_PAYLOAD_GZIPPED
+    )
+    with aioresponses() as mocked:
+        with pytest.raises(Exception) as excinfo:
+            worker.execute(message, TestData.RECEPTOR_CONFIG, queue.Queue())
+        assert "Invalid apply_filter" in str(excinfo.value)
+        assert not mocked.requests
+
+
+def test_execute_filters_are_compiled_once():
+    """ The compiled JMESPath expressions are cached across requests """
+    worker.compile_filter.cache_clear()
+    for _ in range(3):
+        run_get(
+            TestData.RECEPTOR_CONFIG,
+            json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_FILTERED_SINGLE_PAGE_GZIPPED),
+            TestData.JOB_TEMPLATE_RESPONSE,
+        )
+    cache_info = worker.compile_filter.cache_info()
+    assert cache_info.misses == 1
+    assert cache_info.hits == 2
+
+
 def test_execute_monitor_job_success():
     """ Test to Monitor completion of job"""
     response_queue = queue.Queue()
@@ -343,6 +1025,143 @@ def test_execute_monitor_job_success():
         assert key.startswith(TestData.ARTIFACTS_KEY_PREFIX)
 
 
+def test_execute_monitor_reports_polls():
+    """ The adaptive schedule polls quickly and the polls are reported """
+    response_queue = queue.Queue()
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(
+            TestData.JOB_MONITOR_PAYLOAD,
+            refresh_interval_seconds=None,
+            poll_initial_seconds=0.05,
+            poll_jitter=0,
+        )
+    )
+    headers = {"Content-Type": "application/json"}
+
+    with aioresponses() as mocked:
+        for job in (TestData.JOB_1_RUNNING, TestData.JOB_1_RUNNING):
+            mocked.get(
+                TestData.JOB_MONITOR_URL,
+                status=200,
+                body=json.dumps(job),
+                headers=headers,
+            )
+        mocked.get(
+            TestData.JOB_MONITOR_URL,
+            status=200,
+            body=json.dumps(TestData.JOB_1_SUCCESSFUL),
+            headers=headers,
+        )
+        start = time.monotonic()
+        worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+        assert time.monotonic() - start < 1
+
+    response = response_queue.get()
+    assert response["polls"] == 3
+    assert json.loads(response["body"])["status"] == "successful"
+
+
+def test_execute_monitor_jobs_batched_transient_failure():
+    """ A batched query failing with a transient status is sent again on
+        the next poll instead of failing the watchers
+    """
+    config = dict(TestData.RECEPTOR_CONFIG, batch_monitor="True", retries="0")
+    statuses = [502, 200]
+
+    def list_jobs(url, **_kwargs):
+        status = statuses.pop(0)
+        if status != 200:
+            return CallbackResult(status=status, body="Bad Gateway")
+        results = [dict(id=TestData.JOB_ID_1, status="successful")]
+        return CallbackResult(
+            status=200, body=json.dumps(dict(count=1, results=results))
+        )
+
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(TestData.JOB_MONITOR_PAYLOAD, refresh_interval_seconds=0.1)
+    )
+    response_queue = queue.Queue()
+    with aioresponses() as mocked:
+        mocked.get(
+            re.compile(r"^https://www\.example\.com/api/v2/jobs/\?.*$"),
+            callback=list_jobs,
+            repeat=True,
+        )
+        mocked.get(
+            TestData.JOB_MONITOR_URL,
+            status=200,
+            body=json.dumps(TestData.JOB_1_SUCCESSFUL),
+        )
+        worker.execute(message, config, response_queue)
+
+    response = response_queue.get()
+    assert response["status"] == 200
+    assert json.loads(response["body"])["status"] == "successful"
+    assert response["polls"] == 2
+    assert statuses == []
+
+
+def test_execute_monitor_jobs_batched():
+    """ Jobs monitored at the same time share batched list queries """
+    config = dict(TestData.RECEPTOR_CONFIG, batch_monitor="True")
+    job_ids = [TestData.JOB_ID_1, TestData.JOB_ID_1 + 1]
+    queries = []
+    polled = set()
+
+    def list_jobs(url, **_kwargs):
+        ids = [int(job_id) for job_id in url.query["id__in"].split(",")]
+        queries.append(ids)
+        results = []
+        for job_id in ids:
+            status = "successful" if job_id in polled else "running"
+            polled.add(job_id)
+            results.append(dict(id=job_id, status=status))
+        return CallbackResult(
+            status=200, body=json.dumps(dict(count=len(results), results=results))
+        )
+
+    def monitor(job_id, response_queue):
+        message = FakeMessage()
+        message.raw_payload = json.dumps(
+            dict(
+                TestData.JOB_MONITOR_PAYLOAD,
+                href_slug=f"/api/v2/jobs/{job_id}/",
+                refresh_interval_seconds=0.2,
+            )
+        )
+        worker.execute(message, config, response_queue)
+
+    queues = [queue.Queue() for _ in job_ids]
+    with aioresponses() as mocked:
+        mocked.get(
+            re.compile(r"^https://www\.example\.com/api/v2/jobs/\?.*$"),
+            callback=list_jobs,
+            repeat=True,
+        )
+        for job_id in job_ids:
+            mocked.get(
+                f"https://www.example.com/api/v2/jobs/{job_id}/",
+                status=200,
+                body=json.dumps(dict(TestData.JOB_1_SUCCESSFUL, job=job_id)),
+            )
+        threads = [
+            threading.Thread(target=monitor, args=args) for args in zip(job_ids, queues)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert job_ids in queries
+    assert len(queries) <= 3
+    for job_id, response_queue in zip(job_ids, queues):
+        json_response = json.loads(response_queue.get()["body"])
+        assert json_response["status"] == "successful"
+        assert list(json_response["artifacts"]) == list(TestData.FILTERED_JOB_ARTIFACTS)
+
+
 def test_execute_monitor_job_zip_success():
     """ Test to Monitor completion of job"""
     response_queue = queue.Queue()
@@ -375,6 +1194,39 @@ def test_execute_monitor_job_zip_success():
         assert key.startswith(TestData.ARTIFACTS_KEY_PREFIX)
 
 
+def test_execute_monitor_deadline():
+    """ A job stuck in pending doesn't hold the worker past the deadline,
+        a timeout response is sent instead
+    """
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(
+            TestData.JOB_MONITOR_PAYLOAD,
+            refresh_interval_seconds=0.05,
+            timeout_seconds=0.3,
+        )
+    )
+    response_queue = queue.Queue()
+    with aioresponses() as mocked:
+        mocked.get(
+            TestData.JOB_MONITOR_URL,
+            status=200,
+            body=json.dumps(TestData.JOB_1_RUNNING),
+            repeat=True,
+        )
+        start = time.monotonic()
+        worker.execute(message, TestData.RECEPTOR_CONFIG, response_queue)
+        assert time.monotonic() - start < 1
+
+    response = response_queue.get()
+    assert response["status"] == 504
+    assert response["timed_out"]
+    body = json.loads(response["body"])
+    assert body["method"] == "monitor"
+    assert "0.3 seconds" in body["detail"]
+    assert response_queue.empty()
+
+
 def test_execute_monitor_exception():
     """ HTTP POST Test with Exception """
     message = FakeMessage()
@@ -405,3 +1257,655 @@ def test_execute_monitor_job_huge_artifact():
         with pytest.raises(Exception) as excinfo:
             worker.execute(message, TestData.RECEPTOR_CONFIG, queue.Queue())
         assert "Artifacts is over 1024 bytes" in str(excinfo.value)
+        assert f"at {TestData.ARTIFACTS_KEY_PREFIX}_snow_details" in str(excinfo.value)
+
+
+def test_filter_artifacts_size_accounting():
+    """ The size of the artifacts is added up one by one against the limit
+        from the config, the error names the key that went over
+    """
+    prefix = TestData.ARTIFACTS_KEY_PREFIX
+    artifacts = {
+        f"{prefix}ticket": 12345,
+        "private": "p" * 10000,
+        f"{prefix}notes": "n" * 50,
+        f"{prefix}details": dict(rows=["d" * 100] * 1000),
+    }
+    expected = {key: artifacts[key] for key in (f"{prefix}ticket", f"{prefix}notes")}
+    limit = len(json.dumps(expected))
+    run = worker.Run(
+        queue.Queue(),
+        dict(href_slug="api/v2/jobs/1/", method="get"),
+        dict(max_artifacts_size=str(limit + 10)),
+        logger,
+    )
+    with pytest.raises(Exception) as excinfo:
+        run.filter_artifacts(dict(artifacts=artifacts))
+    assert str(excinfo.value).startswith(
+        f"Artifacts is over {limit + 10} bytes, it went over at {prefix}details"
+    )
+    assert f"artifacts before it: {prefix}ticket, {prefix}notes" in str(excinfo.value)
+
+    artifacts.pop(f"{prefix}details")
+    assert run.filter_artifacts(dict(artifacts=artifacts))["artifacts"] == expected
+    run.max_artifacts_size = limit - 1
+    with pytest.raises(Exception, match=f"went over at {prefix}notes"):
+        run.filter_artifacts(dict(artifacts=artifacts))
+
+
+def test_execute_reuses_pooled_session():
+    """ Sessions are pooled per Tower URL and credentials across messages """
+    runtime.RUNTIME.shutdown()
+    for _ in range(2):
+        run_get(
+            TestData.RECEPTOR_CONFIG,
+            json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_GZIPPED),
+            TestData.JOB_TEMPLATE_RESPONSE,
+        )
+    assert len(runtime.RUNTIME.sessions) == 1
+
+    run_get(
+        TestData.RECEPTOR_CONFIG_WITH_TOKEN,
+        json.dumps(TestData.JOB_TEMPLATE_PAYLOAD_SINGLE_PAGE_GZIPPED),
+        TestData.JOB_TEMPLATE_RESPONSE,
+    )
+    assert len(runtime.RUNTIME.sessions) == 2
+
+    sessions = list(runtime.RUNTIME.sessions.values())
+    runtime.RUNTIME.shutdown()
+    assert runtime.RUNTIME.loop is None
+    assert not runtime.RUNTIME.sessions
+    assert all(session.closed for session in sessions)
+
+
+def test_connector_options_from_config():
+    """ Keep-alive and connection limits are read from receptor.conf """
+    options = runtime.Runtime.connector_options(
+        dict(
+            keepalive_timeout="30", connection_limit="20", connection_limit_per_host="4"
+        )
+    )
+    assert options == dict(
+        limit=20, limit_per_host=4, force_close=False, keepalive_timeout=30.0
+    )
+
+    options = runtime.Runtime.connector_options(dict(keepalive="False"))
+    assert options["force_close"]
+    assert "keepalive_timeout" not in options
+
+
+class LocalTower:
+    """ A real HTTP server on localhost serving a canned Tower response
+        or the given routes
+    """
+
+    def __init__(self, response=None, routes=None):
+        self.response = response
+        self.routes = routes or [web.get("/{tail:.*}", self.handler)]
+        self.loop = asyncio.new_event_loop()
+        self.runner = None
+        self.port = None
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    async def handler(self, _request):
+        return web.json_response(self.response)
+
+    async def setup(self):
+        app = web.Application()
+        app.add_routes(self.routes)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.setup(), self.loop).result()
+        return self
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def test_execute_identical_gets_share_one_request():
+    """ Identical GET requests in flight at once share one request to Tower,
+        each caller gets its own filtered response
+    """
+    requests = []
+
+    async def job_templates(request):
+        requests.append(request.path_qs)
+        await asyncio.sleep(0.3)
+        return web.json_response(TestData.JOB_TEMPLATE_RESPONSE)
+
+    filters = [None, dict(results="results[].{id: id, name:name}")] * 3
+    response_queues = [queue.Queue() for _ in filters]
+    with LocalTower(routes=[web.get("/api/v2/job_templates", job_templates)]) as tower:
+        config = dict(token="cafebeef", url=f"http://127.0.0.1:{tower.port}")
+
+        def get(apply_filter, response_queue):
+            payload = dict(href_slug="api/v2/job_templates", method="get", params={})
+            if apply_filter:
+                payload["apply_filter"] = apply_filter
+            message = FakeMessage()
+            message.raw_payload = json.dumps(payload)
+            worker.execute(message, config, response_queue)
+
+        threads = [
+            threading.Thread(target=get, args=args)
+            for args in zip(filters, response_queues)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(requests) == 1
+    for apply_filter, response_queue in zip(filters, response_queues):
+        validate_get_response(
+            response_queue.get(),
+            200,
+            TestData.JOB_TEMPLATE_COUNT,
+            [TestData.JOB_TEMPLATE_1, TestData.JOB_TEMPLATE_2],
+            ["id", "name"] if apply_filter else None,
+        )
+
+
+def test_execute_limits_requests_per_tower():
+    """ The requests to a Tower are limited across Run instances and the
+        time spent waiting is reported
+    """
+    in_flight = []
+    most_in_flight = []
+
+    async def job_templates(_request):
+        in_flight.append(1)
+        most_in_flight.append(len(in_flight))
+        await asyncio.sleep(0.05)
+        in_flight.pop()
+        return web.json_response(TestData.JOB_TEMPLATE_RESPONSE)
+
+    response_queues = [queue.Queue() for _ in range(4)]
+    with LocalTower(routes=[web.get("/api/v2/job_templates", job_templates)]) as tower:
+        config = dict(
+            token="cafebeef", url=f"http://127.0.0.1:{tower.port}", max_in_flight="1",
+        )
+
+        def get(page, response_queue):
+            message = FakeMessage()
+            message.raw_payload = json.dumps(
+                dict(
+                    href_slug="api/v2/job_templates",
+                    method="get",
+                    params={"page": page},
+                )
+            )
+            worker.execute(message, config, response_queue)
+
+        threads = [
+            threading.Thread(target=get, args=args)
+            for args in enumerate(response_queues)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    responses = [response_queue.get() for response_queue in response_queues]
+    assert max(most_in_flight) == 1
+    assert all(response["status"] == 200 for response in responses)
+    waits = sorted(response["queue_wait_seconds"] for response in responses)
+    assert waits[-1] >= 0.1
+
+
+def test_execute_get_read_timeout():
+    """ A Tower that stops answering trips the read timeout """
+
+    async def stalled(_request):
+        await asyncio.sleep(1)
+        return web.json_response(TestData.JOB_TEMPLATE_RESPONSE)
+
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(href_slug="api/v2/job_templates", method="get", retries=0)
+    )
+    with LocalTower(routes=[web.get("/api/v2/job_templates", stalled)]) as tower:
+        config = dict(
+            token="cafebeef",
+            url=f"http://127.0.0.1:{tower.port}",
+            read_timeout_seconds="0.1",
+        )
+        with pytest.raises(asyncio.TimeoutError):
+            worker.execute(message, config, queue.Queue())
+
+
+def test_execute_get_pool_wait_timeout():
+    """ Waiting for a free connection of the pool is limited by the connect
+        timeout too
+    """
+
+    async def stalled(_request):
+        await asyncio.sleep(1)
+        return web.json_response(TestData.JOB_TEMPLATE_RESPONSE)
+
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(href_slug="api/v2/job_templates", method="get", retries=0)
+    )
+    with LocalTower(routes=[web.get("/{tail:.*}", stalled)]) as tower:
+        config = dict(
+            token="cafebeef",
+            url=f"http://127.0.0.1:{tower.port}",
+            connection_limit_per_host="1",
+            connect_timeout_seconds="0.1",
+        )
+
+        async def hold_connection():
+            session = runtime.RUNTIME.session(
+                config["url"], dict(Authorization="Bearer cafebeef"), config
+            )
+            async with session.get(f"{config['url']}/api/v2/held") as response:
+                await response.read()
+
+        held = asyncio.run_coroutine_threadsafe(
+            hold_connection(), runtime.RUNTIME.start()
+        )
+        time.sleep(0.1)
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            worker.execute(message, config, queue.Queue())
+        assert time.monotonic() - start < 0.5
+        held.result()
+
+
+class SyncTower:
+    """ A collection served with the filters, ordering and paging of Tower """
+
+    def __init__(self, objects, on_request=None):
+        self.objects = objects
+        self.requests = []
+        self.on_request = on_request
+
+    async def handler(self, request):
+        self.requests.append(dict(request.query))
+        if self.on_request is not None:
+            self.on_request(len(self.requests))
+        query = request.query
+        objects = [
+            item
+            for item in self.objects
+            if item["modified"] >= query.get("modified__gte", "")
+            and item["modified"] > query.get("modified__gt", "")
+            and item["modified"] == query.get("modified", item["modified"])
+            and item["id"] > int(query.get("id__gt", 0))
+            and item["created"] > query.get("created__gt", "")
+        ]
+        order = query.get("order_by", "id").split(",")
+        objects.sort(key=lambda item: [item[key] for key in order])
+        page_size = int(query.get("page_size", 25))
+        page = int(query.get("page", 1))
+        results = objects[(page - 1) * page_size : page * page_size]
+        more = page * page_size < len(objects)
+        return web.json_response(
+            dict(
+                count=len(objects),
+                next=f"/api/v2/job_templates/?page={page + 1}" if more else None,
+                results=results,
+            )
+        )
+
+    def sync(self, config, cursor=None):
+        """ Run a sync, returns the changed objects and the last message """
+        message = FakeMessage()
+        message.raw_payload = json.dumps(
+            dict(
+                href_slug="api/v2/job_templates/",
+                method="sync",
+                cursor=cursor,
+                params=dict(page_size=2),
+            )
+        )
+        response_queue = queue.Queue()
+        worker.execute(message, config, response_queue)
+        changed = []
+        while True:
+            response = response_queue.get()
+            if response.get("sync_complete"):
+                assert response_queue.empty()
+                return changed, json.loads(response["body"])
+            changed.extend(json.loads(response["body"])["results"])
+
+
+def test_execute_sync_with_cursor():
+    """ A sync sends the objects changed since the cursor and the ids of the
+        collection only when objects were deleted
+    """
+    objects = [
+        dict(id=1, name="one", created="2020-01-01", modified="2020-01-01"),
+        dict(id=2, name="two", created="2020-01-02", modified="2020-01-03"),
+        dict(id=3, name="three", created="2020-01-03", modified="2020-01-03"),
+    ]
+    tower = SyncTower(objects)
+    routes = [web.get("/api/v2/job_templates/", tower.handler)]
+    worker.RESPONSE_CACHE.clear()
+    with LocalTower(routes=routes) as local:
+        config = dict(token="cafebeef", url=f"http://127.0.0.1:{local.port}")
+
+        changed, result = tower.sync(config)
+        assert [item["id"] for item in changed] == [1, 2, 3]
+        assert result == dict(
+            cursor=dict(modified="2020-01-03", id=3, count=3), changed=3
+        )
+
+        changed, result = tower.sync(config, result["cursor"])
+        assert changed == [] and result["changed"] == 0
+        assert "ids" not in result
+
+        objects.pop(0)
+        objects[0]["modified"] = "2020-01-05"
+        objects.append(
+            dict(id=4, name="four", created="2020-01-04", modified="2020-01-04")
+        )
+        tower.requests.clear()
+        changed, result = tower.sync(config, result["cursor"])
+        assert [item["id"] for item in changed] == [4, 2]
+        assert result == dict(
+            cursor=dict(modified="2020-01-05", id=2, count=3), changed=2, ids=[2, 3, 4],
+        )
+        assert tower.requests[0] == dict(
+            page_size="2", order_by="modified,id", modified__gte="2020-01-03"
+        )
+
+
+def test_execute_sync_modified_during_sync():
+    """ An object modified while a sync pages through the collection moves
+        to the end and doesn't make the sync skip the objects after it
+    """
+    objects = [
+        dict(id=i, name=str(i), created="2020-01-01", modified=f"2020-01-0{i}")
+        for i in range(1, 6)
+    ]
+
+    def modify(requests):
+        if requests == 2:
+            objects[0]["modified"] = "2020-01-09"
+
+    tower = SyncTower(objects, modify)
+    routes = [web.get("/api/v2/job_templates/", tower.handler)]
+    with LocalTower(routes=routes) as local:
+        config = dict(token="cafebeef", url=f"http://127.0.0.1:{local.port}")
+        changed, result = tower.sync(config)
+    assert [item["id"] for item in changed] == [1, 2, 3, 4, 5, 1]
+    assert result["cursor"] == dict(modified="2020-01-09", id=1, count=5)
+    assert all("page" not in query for query in tower.requests)
+
+
+def test_execute_sync_modified_at_once():
+    """ More objects modified at the same time than fit in a page are
+        paged by id
+    """
+    objects = [
+        dict(id=i, name=str(i), created="2020-01-01", modified="2020-01-02")
+        for i in range(1, 6)
+    ]
+    objects.append(dict(id=6, name="6", created="2020-01-01", modified="2020-01-03"))
+    tower = SyncTower(objects)
+    routes = [web.get("/api/v2/job_templates/", tower.handler)]
+    with LocalTower(routes=routes) as local:
+        config = dict(token="cafebeef", url=f"http://127.0.0.1:{local.port}")
+        changed, result = tower.sync(config, dict(modified="2020-01-02", id=1, count=6))
+    assert [item["id"] for item in changed] == [2, 3, 4, 5, 6]
+    assert result["cursor"] == dict(modified="2020-01-03", id=6, count=6)
+    assert (
+        dict(page_size="2", order_by="id", modified="2020-01-02", id__gt="2")
+        in tower.requests
+    )
+
+
+def close_wait_sockets(port):
+    """ Count the local sockets connected to port stuck in CLOSE_WAIT """
+    count = 0
+    for name in ("/proc/net/tcp", "/proc/net/tcp6"):
+        if not os.path.exists(name):
+            continue
+        with open(name) as tcp_table:
+            for line in tcp_table.readlines()[1:]:
+                fields = line.split()
+                remote_port = int(fields[2].split(":")[1], 16)
+                if remote_port == port and fields[3] == "08":
+                    count += 1
+    return count
+
+
+def test_execute_and_shutdown_without_fixed_sleep():
+    """ Requests and pool shutdown don't wait on a fixed sleep
+        and don't leave sockets in CLOSE_WAIT
+    """
+    runtime.RUNTIME.shutdown()
+    payload = dict(href_slug="api/v2/job_templates", method="get", params={})
+    with LocalTower(TestData.JOB_TEMPLATE_RESPONSE) as tower:
+        config = dict(
+            username="fred", password="radia", url=f"http://127.0.0.1:{tower.port}"
+        )
+        for _ in range(3):
+            message = FakeMessage()
+            message.raw_payload = json.dumps(payload)
+            response_queue = queue.Queue()
+            start = time.monotonic()
+            worker.execute(message, config, response_queue)
+            assert time.monotonic() - start < 0.25
+            assert response_queue.get()["status"] == 200
+
+        start = time.monotonic()
+        runtime.RUNTIME.shutdown()
+        assert time.monotonic() - start < 0.25
+        assert close_wait_sockets(tower.port) == 0
+
+
+def run_monitor_websocket(routes):
+    """ Monitor a job on a local Tower with the given routes """
+    response_queue = queue.Queue()
+    message = FakeMessage()
+    message.raw_payload = json.dumps(
+        dict(
+            TestData.JOB_MONITOR_PAYLOAD,
+            href_slug=f"/api/v2/jobs/{TestData.JOB_ID_1}/",
+            monitor_websocket=True,
+            refresh_interval_seconds=0.1,
+        )
+    )
+    with LocalTower(routes=routes) as tower:
+        config = dict(token="cafebeef", url=f"http://127.0.0.1:{tower.port}")
+        worker.execute(message, config, response_queue)
+    return response_queue.get()
+
+
+async def accept_websocket(request):
+    """ Accept a websocket the way Tower does """
+    socket = web.WebSocketResponse()
+    await socket.prepare(request)
+    await socket.send_json(dict(accept=True, user=1))
+    return socket
+
+
+def test_execute_monitor_websocket():
+    """ The job completes as soon as its terminal status event arrives """
+    events = []
+    jobs = [TestData.JOB_1_RUNNING, TestData.JOB_1_SUCCESSFUL]
+
+    async def job_detail(_request):
+        return web.json_response(jobs.pop(0))
+
+    async def websocket(request):
+        socket = await accept_websocket(request)
+        events.append(json.loads(await socket.receive_str()))
+        await socket.send_json(dict(groups_current=dict(jobs=["status_changed"])))
+        await asyncio.sleep(0.05)
+        await socket.send_json(dict(unified_job_id=1, status="successful"))
+        await socket.send_json(dict(unified_job_id=TestData.JOB_ID_1, status="running"))
+        await socket.send_json(
+            dict(unified_job_id=TestData.JOB_ID_1, status="successful")
+        )
+        await socket.receive()
+        return socket
+
+    response = run_monitor_websocket(
+        [
+            web.get(f"/api/v2/jobs/{TestData.JOB_ID_1}/", job_detail),
+            web.get("/websocket/", websocket),
+        ]
+    )
+    assert events == [{"groups": {"jobs": ["status_changed"]}}]
+    assert response["polls"] == 2
+    json_response = json.loads(response["body"])
+    assert json_response["status"] == "successful"
+    assert list(json_response["artifacts"]) == list(TestData.FILTERED_JOB_ARTIFACTS)
+
+
+def test_execute_monitor_websocket_falls_back_to_polling():
+    """ When the socket drops the job is polled """
+    jobs = [TestData.JOB_1_RUNNING, TestData.JOB_1_RUNNING, TestData.JOB_1_SUCCESSFUL]
+
+    async def job_detail(_request):
+        return web.json_response(jobs.pop(0))
+
+    async def websocket(request):
+        socket = await accept_websocket(request)
+        await socket.receive_str()
+        await socket.close()
+        return socket
+
+    response = run_monitor_websocket(
+        [
+            web.get(f"/api/v2/jobs/{TestData.JOB_ID_1}/", job_detail),
+            web.get("/websocket/", websocket),
+        ]
+    )
+    assert not jobs
+    assert json.loads(response["body"])["status"] == "successful"
+
+
+def test_execute_monitor_websocket_subscription_rejected():
+    """ An error reply to the subscription falls back to polling right away
+        even though the socket stays open
+    """
+    jobs = [TestData.JOB_1_RUNNING, TestData.JOB_1_SUCCESSFUL]
+
+    async def job_detail(_request):
+        return web.json_response(jobs.pop(0))
+
+    async def websocket(request):
+        socket = await accept_websocket(request)
+        await socket.receive_str()
+        await socket.send_json(dict(error="access denied to channel"))
+        await socket.receive()
+        return socket
+
+    start = time.monotonic()
+    response = run_monitor_websocket(
+        [
+            web.get(f"/api/v2/jobs/{TestData.JOB_ID_1}/", job_detail),
+            web.get("/websocket/", websocket),
+        ]
+    )
+    assert time.monotonic() - start < 2
+    assert not jobs
+    assert json.loads(response["body"])["status"] == "successful"
+
+
+def test_execute_monitor_websocket_polls_without_events():
+    """ The job is polled on the schedule when no status event arrives """
+    jobs = [TestData.JOB_1_RUNNING, TestData.JOB_1_RUNNING, TestData.JOB_1_SUCCESSFUL]
+
+    async def job_detail(_request):
+        return web.json_response(jobs.pop(0) if len(jobs) > 1 else jobs[0])
+
+    async def websocket(request):
+        socket = await accept_websocket(request)
+        await socket.receive_str()
+        await socket.send_json(dict(groups_current=dict(jobs=["status_changed"])))
+        await socket.receive()
+        return socket
+
+    start = time.monotonic()
+    response = run_monitor_websocket(
+        [
+            web.get(f"/api/v2/jobs/{TestData.JOB_ID_1}/", job_detail),
+            web.get("/websocket/", websocket),
+        ]
+    )
+    assert time.monotonic() - start < 2
+    assert response["polls"] == 4
+    assert json.loads(response["body"])["status"] == "successful"
+
+
+def test_execute_monitor_websockets_outside_the_pool():
+    """ The websockets of the monitors don't take the pooled connections,
+        more monitors than the per host limit complete and their polls
+        still get through
+    """
+    sockets = []
+    done = []
+
+    async def job_detail(_request):
+        return web.json_response(
+            TestData.JOB_1_SUCCESSFUL if done else TestData.JOB_1_RUNNING
+        )
+
+    async def websocket(request):
+        socket = await accept_websocket(request)
+        await socket.receive_str()
+        await socket.send_json(dict(groups_current=dict(jobs=["status_changed"])))
+        sockets.append(socket)
+        if len(sockets) == 3:
+            done.append(True)
+            for each in sockets:
+                await each.send_json(
+                    dict(unified_job_id=TestData.JOB_ID_1, status="successful")
+                )
+        await socket.receive()
+        return socket
+
+    routes = [
+        web.get(f"/api/v2/jobs/{TestData.JOB_ID_1}/", job_detail),
+        web.get("/websocket/", websocket),
+    ]
+    response_queues = [queue.Queue() for _ in range(3)]
+    with LocalTower(routes=routes) as tower:
+        config = dict(
+            token="cafebeef",
+            url=f"http://127.0.0.1:{tower.port}",
+            connection_limit_per_host="2",
+        )
+
+        def monitor(response_queue):
+            message = FakeMessage()
+            message.raw_payload = json.dumps(
+                dict(
+                    TestData.JOB_MONITOR_PAYLOAD,
+                    href_slug=f"/api/v2/jobs/{TestData.JOB_ID_1}/",
+                    monitor_websocket=True,
+                    refresh_interval_seconds=0.1,
+                    timeout_seconds=5,
+                )
+            )
+            worker.execute(message, config, response_queue)
+
+        threads = [
+            threading.Thread(target=monitor, args=(response_queue,))
+            for response_queue in response_queues
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(sockets) == 3
+    for response_queue in response_queues:
+        response = response_queue.get()
+        assert response["status"] == 200
+        assert json.loads(response["body"])["status"] == "successful"
@@ -0,0 +1,46 @@
+""" Test the preset dictionary compression """
+import json
+import zlib
+import pytest
+from receptor_catalog import zdict
+from test_data import TestData
+
+
+def test_compress_roundtrip():
+    """ Data compressed with the shipped dictionary can be decompressed """
+    data = json.dumps(TestData.JOB_TEMPLATE_POST_RESPONSE).encode("utf-8")
+    compressed = zdict.compress(data)
+    assert zdict.is_zdict(compressed)
+    assert compressed[2] == zdict.VERSION
+    assert zdict.decompress(compressed) == data
+
+
+def test_dictionary_beats_plain_zlib():
+    """ A small Tower object compresses better with the dictionary """
+    data = json.dumps(TestData.JOB_1_SUCCESSFUL, separators=(",", ":")).encode()
+    assert len(zdict.compress(data)) < len(zlib.compress(data, 6)) + 3
+
+
+def test_decompress_errors():
+    """ Only data with the zdict magic and a known version is accepted """
+    with pytest.raises(Exception) as excinfo:
+        zdict.decompress(b"\x1f\x8b not zdict")
+    assert "not compressed with a zdict dictionary" in str(excinfo.value)
+    with pytest.raises(Exception) as excinfo:
+        zdict.decompress(zdict.MAGIC + bytes([255]) + b"data")
+    assert "Unknown zdict dictionary version 255" in str(excinfo.value)
+
+
+def test_build_dictionary():
+    """ Fragments shared by the samples make up the dictionary """
+    samples = [
+        json.dumps(
+            dict(id=object_id, type="job_template", url=f"/api/v2/{object_id}/")
+        ).encode("utf-8")
+        for object_id in range(10)
+    ]
+    samples.append(b'{"unique_to_one_sample": true}')
+    dictionary = zdict.build_dictionary(samples, size=64)
+    assert len(dictionary) <= 64
+    assert b' "type": "job_template",' in dictionary
+    assert b"unique_to_one_sample" not in dictionary
@@ -0,0 +1,64 @@
+"""
+  Build a zlib preset dictionary from captured Tower responses
+
+  Every sample file holds one response body captured from the Tower API,
+  directories are searched for *.json files.
+
+  python tools/build_zdict.py --version 2 samples/
+  python tools/build_zdict.py --output /tmp/tower.zdict samples/*.json
+"""
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from receptor_catalog import zdict  # noqa: E402
+from receptor_catalog.codec import raw_body_document  # noqa: E402
+
+
+def sample_files(paths):
+    """ Expand the directories into the sample files they contain """
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(
+                glob.glob(os.path.join(path, "**", "*.json"), recursive=True)
+            )
+        else:
+            yield path
+
+
+def read_samples(paths):
+    """ Read the samples wrapped the way the worker compresses them """
+    for name in sample_files(paths):
+        with open(name, "r") as sample_file:
+            body = sample_file.read().strip()
+        yield raw_body_document(200, body).encode("utf-8")
+
+
+def main():
+    """ Build the dictionary and report its size """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("samples", nargs="+", help="sample files or directories")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--version", type=int, help="write the dictionary shipped for this version"
+    )
+    target.add_argument("--output", help="write the dictionary to this file")
+    parser.add_argument("--size", type=int, default=zdict.DICTIONARY_SIZE)
+    args = parser.parse_args()
+
+    samples = list(read_samples(args.samples))
+    dictionary = zdict.build_dictionary(samples, args.size)
+    output = args.output or zdict.dictionary_path(args.version)
+    with open(output, "wb") as dictionary_file:
+        dictionary_file.write(dictionary)
+    print(
+        f"Wrote {len(dictionary)} bytes built from {len(samples)} samples to {output}"
+    )
+
+
+if __name__ == "__main__":
+    main()